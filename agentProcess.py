@@ -0,0 +1,182 @@
+# agentProcess.py
+# ---------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Runs agents in processes of their own, so that an agent that crashes, hogs
+memory or prints cannot disturb the game or the other agents.
+
+A ProcessAgent stands in for the agent in the game and passes each call on
+to a worker process that holds the real agent.  States go over the pipe in
+the compact GameState.encode format, and each layout is sent only once.
+The worker lives from game to game, so the agent's module is imported and
+its caches filled once per run rather than once per game.  If the worker
+dies, or a call to it fails or is interrupted, it is stopped and a fresh
+one started for the next game.
+"""
+from game import Agent
+import multiprocessing, multiprocessing.pool
+import random, traceback
+
+class ProcessAgent(Agent):
+    """
+    Plays as the agent agentName( *agentArgs, **agentKeyArgs ) running in a
+    worker process.  memoryLimit caps the worker's address space in
+    megabytes, and cpuLimit the processor seconds it may use in each game;
+    an agent over either limit crashes.
+    """
+    def __init__(self, agentName, index=0, agentArgs=(), agentKeyArgs={}, memoryLimit=None, cpuLimit=None):
+        Agent.__init__(self, index)
+        self.agentName = agentName
+        self.agentArgs = agentArgs
+        self.agentKeyArgs = agentKeyArgs
+        self.memoryLimit = memoryLimit
+        self.cpuLimit = cpuLimit
+        self.process = None
+        self.pipe = None
+        self.layouts = set()
+
+    def start(self):
+        pipe, workerPipe = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=serveAgent, args=(workerPipe, self.agentName, self.agentArgs,
+                                                                        self.agentKeyArgs, self.memoryLimit, self.cpuLimit))
+        self.process.daemon = True
+        self.process.start()
+        workerPipe.close()
+        self.pipe = pipe
+        self.layouts = set()
+
+    def stop(self):
+        "Stops the worker process, if there is one"
+        if self.process == None: return
+        try:
+            self.pipe.send(('stop', ()))
+        except (IOError, EOFError):
+            pass
+        self.pipe.close()
+        self.process.join(1)
+        if self.process.is_alive(): self.process.terminate()
+        self.process = None
+        self.pipe = None
+
+    def call(self, command, *args):
+        """
+        Has the worker carry out command and returns its result.  Any
+        failure stops the worker, since its state can no longer be trusted.
+        """
+        try:
+            self.pipe.send((command, args))
+            outcome, result = self.pipe.recv()
+        except EOFError:
+            self.stop()
+            raise Exception('The process of agent %d (%s) died' % (self.index, self.agentName))
+        except:
+            self.stop()
+            raise
+        if outcome == 'error':
+            self.stop()
+            raise Exception('Agent %d (%s) failed in its process:\n%s' % (self.index, self.agentName, result))
+        return result
+
+    def encode(self, state):
+        "Encodes state, sending its layout to the worker first if need be"
+        layout = state.data.layout
+        key = layout.getContentHash()
+        if key not in self.layouts:
+            self.call('layout', key, layout)
+            self.layouts.add(key)
+        return key, state.encode()
+
+    def registerInitialState(self, state):
+        if self.process == None or not self.process.is_alive():
+            self.stop()
+            self.start()
+        # The worker's random module follows this one's, so seeded runs repeat
+        self.call('start', random.getrandbits(32), *self.encode(state))
+
+    def getAction(self, state):
+        return self.call('getAction', *self.encode(state))
+
+    def final(self, state):
+        self.call('final', *self.encode(state))
+
+class HostProcess(multiprocessing.Process):
+    """
+    A process that is never daemonic.  Daemonic processes may not start
+    processes of their own, which the ProcessAgents in them need to do.
+    """
+    def _getDaemon(self):
+        return False
+
+    def _setDaemon(self, daemon):
+        pass
+
+    daemon = property(_getDaemon, _setDaemon)
+
+class HostPool(multiprocessing.pool.Pool):
+    """
+    A multiprocessing Pool whose workers can play games with ProcessAgents.
+    As its workers are not daemonic, it must be closed or terminated before
+    the program ends.
+    """
+    Process = HostProcess
+
+def serveAgent(pipe, agentName, agentArgs, agentKeyArgs, memoryLimit, cpuLimit):
+    """
+    The main loop of a ProcessAgent's worker process.  Every command gets
+    the reply ('ok', result) or ('error', traceback).
+    """
+    import pacman, resource
+    if memoryLimit != None:
+        limit = memoryLimit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    agent = pacman.loadAgent(agentName, True)(*agentArgs, **agentKeyArgs)
+    layouts = {}
+    while True:
+        try:
+            command, args = pipe.recv()
+        except EOFError:
+            break
+        if command == 'stop': break
+        try:
+            result = None
+            if command == 'layout':
+                key, layout = args
+                layouts[key] = layout
+            elif command == 'start':
+                seed, key, blob = args
+                random.seed(seed)
+                if cpuLimit != None:
+                    # Allow cpuLimit more seconds for this game
+                    usage = resource.getrusage(resource.RUSAGE_SELF)
+                    limit = int(usage.ru_utime + usage.ru_stime + cpuLimit + 1)
+                    resource.setrlimit(resource.RLIMIT_CPU, (limit, resource.getrlimit(resource.RLIMIT_CPU)[1]))
+                if hasattr(agent, 'registerInitialState'):
+                    agent.registerInitialState(pacman.GameState.decode(layouts[key], blob))
+            elif command == 'getAction':
+                key, blob = args
+                state = pacman.GameState.decode(layouts[key], blob)
+                if hasattr(agent, 'observationFunction'):
+                    state = agent.observationFunction(state)
+                result = agent.getAction(state)
+            elif command == 'final':
+                key, blob = args
+                if hasattr(agent, 'final'):
+                    agent.final(pacman.GameState.decode(layouts[key], blob))
+            else:
+                raise Exception('Unknown command ' + str(command))
+            reply = ('ok', result)
+        except Exception:
+            reply = ('error', traceback.format_exc())
+        pipe.send(reply)
+    pipe.close()
@@ -0,0 +1,335 @@
+# batchPacman.py
+# --------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Plays many games of Pacman on one layout in lock step, keeping the games
+in numpy arrays rather than GameState objects.  It is meant for workloads
+that need millions of moves of simple pacman policies against RandomGhost
+or DirectionalGhost ghosts.
+
+The rules are those of PacmanRules and GhostRules in pacman.py, and
+crossCheck replays batch games in pacman.GameState to show that the two
+agree.  To check a layout, type
+
+  python batchPacman.py -l mediumClassic -g directional
+"""
+import numpy
+from game import Directions, Actions, DIRECTIONS
+from pacman import SCARED_TIME, COLLISION_TOLERANCE, TIME_PENALTY
+
+# Actions are numbered by their place in this list, as everywhere directions are numbers
+ACTIONS = DIRECTIONS
+STOP = ACTIONS.index(Directions.STOP)
+VECTORS = numpy.array([Actions.directionToVector(action) for action in ACTIONS], dtype=int)
+
+GHOST_POLICIES = ['random', 'directional']
+
+class BatchPacman:
+    """
+    numGames games of a layout, played a round at a time: pacman moves in
+    every game, then each ghost in turn.  The ghosts follow RandomGhost or
+    DirectionalGhost, chosen by ghostPolicy.
+
+    Agent 0 is pacman and agents 1 to numGhosts are the ghosts, as in
+    GameState.  Positions are in half squares, since scared ghosts move
+    half a square at a time.  The arrays of the games are:
+
+      positions   (games, agents, 2) positions, in half squares
+      directions  (games, agents) the action each agent last moved in
+      scaredTimers (games, agents) moves each ghost stays scared for
+      food        (games, layout.totalFood) whether each of
+                  layout.foodPositions still has food
+      capsules    (games, len(layout.capsules)) likewise for capsules
+      numFood, scores, wins, losses  (games,)
+    """
+    def __init__(self, layout, numGames, numGhosts=None, ghostPolicy='random', seed=None,
+                 prob_attack=0.8, prob_scaredFlee=0.8):
+        if ghostPolicy not in GHOST_POLICIES:
+            raise Exception('Unknown ghost policy ' + str(ghostPolicy))
+        if numGhosts == None: numGhosts = layout.getNumGhosts()
+        self.layout = layout
+        self.numGames = numGames
+        self.ghostPolicy = ghostPolicy
+        self.prob_attack = prob_attack
+        self.prob_scaredFlee = prob_scaredFlee
+        self.random = numpy.random.RandomState(seed)
+
+        # Agents start where GameStateData.initialize puts them
+        starts = []
+        for isPacman, pos in layout.agentPositions:
+            if not isPacman:
+                if len(starts) == numGhosts + 1: continue
+            starts.append(pos)
+        self.numAgents = len(starts)
+        self.numGhosts = self.numAgents - 1
+        self.starts = 2 * numpy.array(starts, dtype=int)
+
+        # legal[x, y, a]: pacman at (x, y) may take action a
+        # ghostLegal[x, y, d, a]: a ghost at (x, y) travelling in d may take action a
+        width, height = layout.width, layout.height
+        self.legal = numpy.zeros((width, height, len(ACTIONS)), bool)
+        self.ghostLegal = numpy.zeros((width, height, len(ACTIONS), len(ACTIONS)), bool)
+        for x in range(width):
+            for y in range(height):
+                possible = layout.getPossibleActions((x, y))
+                if possible == None: continue
+                for action in possible:
+                    self.legal[x, y, ACTIONS.index(action)] = True
+                for d, direction in enumerate(ACTIONS):
+                    for action in layout.getGhostActions((x, y), direction):
+                        self.ghostLegal[x, y, d, ACTIONS.index(action)] = True
+
+        # Number of the food or capsule at each square, or -1
+        self.foodIndex = -numpy.ones((width, height), int)
+        for i, (x, y) in enumerate(layout.foodPositions): self.foodIndex[x, y] = i
+        self.capsuleIndex = -numpy.ones((width, height), int)
+        for i, (x, y) in enumerate(layout.capsules): self.capsuleIndex[x, y] = i
+
+        self.positions = numpy.zeros((numGames, self.numAgents, 2), int)
+        self.directions = numpy.zeros((numGames, self.numAgents), int)
+        self.scaredTimers = numpy.zeros((numGames, self.numAgents), int)
+        self.food = numpy.zeros((numGames, layout.totalFood), bool)
+        self.capsules = numpy.zeros((numGames, len(layout.capsules)), bool)
+        self.numFood = numpy.zeros(numGames, int)
+        self.scores = numpy.zeros(numGames, int)
+        self.wins = numpy.zeros(numGames, bool)
+        self.losses = numpy.zeros(numGames, bool)
+        # The action each agent took in the last round, or -1 if it did not move
+        self.lastActions = -numpy.ones((numGames, self.numAgents), int)
+        self.reset()
+
+    def reset(self, games=None):
+        """
+        Starts the given games, a mask or list of indices, or every game, afresh.
+        """
+        if games is None: games = slice(None)
+        self.positions[games] = self.starts
+        self.directions[games] = STOP
+        self.scaredTimers[games] = 0
+        self.food[games] = True
+        self.capsules[games] = True
+        self.numFood[games] = self.layout.totalFood
+        self.scores[games] = 0
+        self.wins[games] = False
+        self.losses[games] = False
+        self.lastActions[games] = -1
+
+    def isOver(self):
+        "Returns a mask of the games that have been won or lost"
+        return self.wins | self.losses
+
+    def getLegalPacmanActions(self):
+        "Returns a (games, len(ACTIONS)) mask of the actions pacman may take"
+        x, y = self.positions[:, 0, 0] // 2, self.positions[:, 0, 1] // 2
+        return self.legal[x, y]
+
+    def getRandomPacmanActions(self):
+        "Returns a legal action for pacman in every game, chosen uniformly"
+        return self.sample(self.getLegalPacmanActions().astype(float))
+
+    def step(self, pacmanActions):
+        """
+        Plays a round of every game that is not over: pacman takes the
+        action numbered pacmanActions[i] in game i, then the ghosts move.
+        A game that ends part way through a round stops there.  Returns the
+        change in score of every game.
+        """
+        pacmanActions = numpy.asarray(pacmanActions, dtype=int)
+        scores = self.scores.copy()
+        self.lastActions[:] = -1
+        self.movePacman(numpy.flatnonzero(~self.isOver()), pacmanActions)
+        for ghost in range(1, self.numAgents):
+            self.moveGhost(numpy.flatnonzero(~self.isOver()), ghost)
+        return self.scores - scores
+
+    def movePacman(self, games, actions):
+        "PacmanRules.applyAction, then the time penalty and GhostRules.checkDeath"
+        if len(games) == 0: return
+        actions = actions[games]
+        x, y = self.positions[games, 0, 0] // 2, self.positions[games, 0, 1] // 2
+        if not self.legal[x, y, actions].all():
+            raise Exception("Illegal action in games " + str(list(games[~self.legal[x, y, actions]])))
+        self.positions[games, 0] += 2 * VECTORS[actions]
+        moving = actions != STOP
+        self.directions[games[moving], 0] = actions[moving]
+        self.lastActions[games, 0] = actions
+        x, y = x + VECTORS[actions, 0], y + VECTORS[actions, 1]
+        scoreChange = numpy.zeros(len(games), int)
+
+        # Eat food
+        food = self.foodIndex[x, y]
+        eats = food >= 0
+        eats[eats] = self.food[games[eats], food[eats]]
+        self.food[games[eats], food[eats]] = False
+        self.numFood[games[eats]] -= 1
+        scoreChange += 10 * eats
+        won = eats & (self.numFood[games] == 0)
+        scoreChange += 500 * won
+        self.wins[games[won]] = True
+
+        # Eat capsules, which scare every ghost
+        capsule = self.capsuleIndex[x, y]
+        eats = capsule >= 0
+        eats[eats] = self.capsules[games[eats], capsule[eats]]
+        self.capsules[games[eats], capsule[eats]] = False
+        self.scaredTimers[games[eats], 1:] = SCARED_TIME
+
+        scoreChange -= TIME_PENALTY
+        for ghost in range(1, self.numAgents):
+            self.checkDeath(games, ghost, scoreChange)
+        self.scores[games] += scoreChange
+
+    def moveGhost(self, games, ghost):
+        "GhostRules.applyAction, decrementTimer and checkDeath"
+        if len(games) == 0: return
+        positions = self.positions[games, ghost]
+        directions = self.directions[games, ghost]
+        scared = self.scaredTimers[games, ghost] > 0
+
+        # Between grid points a ghost carries straight on
+        legal = numpy.zeros((len(games), len(ACTIONS)), bool)
+        onGrid = (positions % 2 == 0).all(1)
+        x, y = positions[onGrid, 0] // 2, positions[onGrid, 1] // 2
+        legal[onGrid] = self.ghostLegal[x, y, directions[onGrid]]
+        legal[numpy.flatnonzero(~onGrid), directions[~onGrid]] = True
+
+        if self.ghostPolicy == 'random':
+            actions = self.sample(legal.astype(float))
+        else:
+            actions = self.sample(self.directionalDistribution(games, ghost, legal, scared))
+        actions[~legal.any(1)] = STOP
+        speeds = numpy.where(scared, 1, 2)
+        self.positions[games, ghost] += VECTORS[actions] * speeds[:, None]
+        self.directions[games, ghost] = numpy.where(actions == STOP, directions, actions)
+        self.lastActions[games, ghost] = actions
+
+        # A ghost that stops being scared moves to the nearest grid point
+        timers = self.scaredTimers[games, ghost]
+        calmed = games[timers == 1]
+        self.positions[calmed, ghost] = (self.positions[calmed, ghost] + 1) // 2 * 2
+        self.scaredTimers[games, ghost] = numpy.maximum(0, timers - 1)
+
+        scoreChange = numpy.zeros(len(games), int)
+        self.checkDeath(games, ghost, scoreChange)
+        self.scores[games] += scoreChange
+
+    def checkDeath(self, games, ghost, scoreChange):
+        "GhostRules.collide for ghost in the games where it can kill pacman"
+        distances = abs(self.positions[games, ghost] - self.positions[games, 0]).sum(1)
+        caught = distances <= 2 * COLLISION_TOLERANCE
+        eaten = caught & (self.scaredTimers[games, ghost] > 0)
+        scoreChange += 200 * eaten
+        self.positions[games[eaten], ghost] = self.starts[ghost]
+        self.directions[games[eaten], ghost] = STOP
+        self.scaredTimers[games[eaten], ghost] = 0
+        kills = caught & ~eaten & ~self.wins[games]
+        scoreChange -= 500 * kills
+        self.losses[games[kills]] = True
+
+    def directionalDistribution(self, games, ghost, legal, scared):
+        "DirectionalGhost.getDistribution for ghost in each of games"
+        speeds = numpy.where(scared, 1, 2)
+        positions = self.positions[games, ghost][:, None, :] + VECTORS[None, :, :] * speeds[:, None, None]
+        distances = abs(positions - self.positions[games, 0][:, None, :]).sum(2)
+        far = distances.max() + 1
+        nearest = numpy.where(legal, distances, far).min(1)
+        furthest = numpy.where(legal, distances, -far).max(1)
+        best = legal & (distances == numpy.where(scared, furthest, nearest)[:, None])
+        bestProb = numpy.where(scared, self.prob_scaredFlee, self.prob_attack)
+        numBest = numpy.maximum(best.sum(1), 1)
+        numLegal = numpy.maximum(legal.sum(1), 1)
+        return best * (bestProb / numBest)[:, None] + legal * ((1 - bestProb) / numLegal)[:, None]
+
+    def sample(self, weights):
+        "Draws the number of a column of each row, with chance proportional to weights"
+        cumulative = weights.cumsum(1)
+        choices = self.random.random_sample(len(weights)) * cumulative[:, -1]
+        return (cumulative > choices[:, None]).argmax(1)
+
+def crossCheck(layout, numGames=16, maxRounds=1000, ghostPolicy='random', seed=0):
+    """
+    Plays numGames batch games with random pacman moves, replaying every
+    move in a pacman.GameState, and raises an Exception at the first place
+    they differ.  Returns the number of moves checked.
+    """
+    import pacman
+    batch = BatchPacman(layout, numGames, ghostPolicy=ghostPolicy, seed=seed)
+    states = []
+    for i in range(numGames):
+        state = pacman.GameState()
+        state.initialize(layout, batch.numGhosts)
+        states.append(state)
+    moves = 0
+    for round in range(maxRounds):
+        if batch.isOver().all(): break
+        batch.step(batch.getRandomPacmanActions())
+        for i in range(numGames):
+            for agentIndex, action in enumerate(batch.lastActions[i]):
+                if action < 0: continue
+                states[i] = states[i].generateSuccessor(agentIndex, ACTIONS[action])
+                moves += 1
+            difference = compareGame(batch, i, states[i])
+            if difference != None:
+                raise Exception('Game %d differs in round %d: %s' % (i, round + 1, difference))
+    return moves
+
+def compareGame(batch, i, state):
+    """
+    Returns what differs between game i of batch and state, or None if
+    nothing does.
+    """
+    data = state.data
+    for agentIndex, agentState in enumerate(data.agentStates):
+        x, y = agentState.getPosition()
+        if (2 * x, 2 * y) != tuple(batch.positions[i, agentIndex]):
+            return 'agent %d is at %s, not %s' % (agentIndex, (x, y), tuple(batch.positions[i, agentIndex] / 2.0))
+        if agentState.getDirection() != ACTIONS[batch.directions[i, agentIndex]]:
+            return 'agent %d is heading %s' % (agentIndex, agentState.getDirection())
+        if agentState.scaredTimer != batch.scaredTimers[i, agentIndex]:
+            return 'agent %d is scared for %d' % (agentIndex, agentState.scaredTimer)
+    if data.score != batch.scores[i]:
+        return 'the score is %d, not %d' % (data.score, batch.scores[i])
+    if state.isWin() != batch.wins[i] or state.isLose() != batch.losses[i]:
+        return 'the game is won %s, lost %s' % (state.isWin(), state.isLose())
+    food = [data.food[x][y] for x, y in batch.layout.foodPositions]
+    if food != list(batch.food[i]) or state.getNumFood() != batch.numFood[i]:
+        return 'the food differs'
+    capsules = [capsule in data.capsules for capsule in batch.layout.capsules]
+    if capsules != list(batch.capsules[i]):
+        return 'the capsules differ'
+    return None
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python batchPacman.py [options]')
+    parser.add_option('-l', '--layout', dest='layout', default='mediumClassic',
+                      help='The layout to check [Default: %default]')
+    parser.add_option('-g', '--ghosts', dest='ghostPolicy', type='choice', choices=GHOST_POLICIES, default='random',
+                      help='How the ghosts move: random or directional [Default: %default]')
+    parser.add_option('-n', '--numGames', dest='numGames', type='int', default=64,
+                      help='How many games to play in the batch [Default: %default]')
+    parser.add_option('-s', '--seed', dest='seed', type='int', default=0,
+                      help='Seed of the random moves [Default: %default]')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+if __name__ == '__main__':
+    import sys, layout
+    options = readCommand(sys.argv[1:])
+    lay = layout.getLayout(options.layout)
+    if lay == None: raise Exception("The layout " + options.layout + " cannot be found")
+    moves = crossCheck(lay, options.numGames, ghostPolicy=options.ghostPolicy, seed=options.seed)
+    print '%d moves of %d games on %s agree with pacman.GameState' % (moves, options.numGames, options.layout)
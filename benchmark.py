@@ -0,0 +1,355 @@
+# benchmark.py
+# ------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Throughput benchmarks for the Pacman engine.
+
+To run every benchmark on the default layouts, type
+
+  python benchmark.py
+
+or name the benchmarks and layouts you are interested in:
+
+  python benchmark.py -l bigMaze,originalClassic grid
+"""
+import layout
+import sys, time
+
+BIGGEST_LAYOUTS = 'bigMaze,bigCorners,openMaze,originalClassic,mediumClassic'
+
+def timePerCall(function, repeats):
+    """
+    Returns the average wall time in seconds of calling function().
+    """
+    start = time.time()
+    for i in range(repeats):
+        function()
+    return (time.time() - start) / repeats
+
+def report(name, seconds, extra=''):
+    print '  %-28s %12.1f /s  %s' % (name, 1.0 / max(seconds, 1e-9), extra)
+
+def benchmarkGrid(layouts, repeats):
+    """
+    Serializing and rebuilding the food and wall grids in both the packBits
+    tuple format and the packBytes format.
+    """
+    from game import reconstituteGrid
+    for lay in layouts:
+        print '%s (%dx%d)' % (lay.name, lay.width, lay.height)
+        for label, grid in [('food', lay.food), ('walls', lay.walls)]:
+            bits, packed = grid.packBits(), grid.packBytes()
+            report(label + ' packBits', timePerCall(grid.packBits, repeats), '%d ints' % (len(bits) - 2))
+            report(label + ' unpack tuple', timePerCall(lambda: reconstituteGrid(bits), repeats))
+            report(label + ' packBytes', timePerCall(grid.packBytes, repeats), '%d bytes' % len(packed))
+            report(label + ' unpack bytes', timePerCall(lambda: reconstituteGrid(packed), repeats))
+
+def breadthFirstExpansion(lay, limit, keep=None):
+    """
+    Expands states of lay breadth first, every agent taking its turn in
+    order, until limit successors have been generated.  Returns the number
+    of successors generated.  If keep is a list, every successor is
+    appended to it.
+    """
+    import pacman
+    start = pacman.GameState()
+    start.initialize(lay, lay.getNumGhosts())
+    frontier = [(start, 0)]
+    generated = 0
+    while frontier and generated < limit:
+        nextFrontier = []
+        for state, agentIndex in frontier:
+            nextIndex = (agentIndex + 1) % state.getNumAgents()
+            for action in state.getLegalActions(agentIndex):
+                successor = state.generateSuccessor(agentIndex, action)
+                generated += 1
+                if keep != None: keep.append(successor)
+                if not (successor.isWin() or successor.isLose()):
+                    nextFrontier.append((successor, nextIndex))
+        frontier = nextFrontier
+    return generated
+
+def benchmarkSuccessors(layouts, repeats):
+    """
+    Successor states generated per second while expanding each layout
+    breadth first.
+    """
+    for lay in layouts:
+        limit = repeats * 100
+        start = time.time()
+        generated = breadthFirstExpansion(lay, limit)
+        seconds = time.time() - start
+        print '%s (%dx%d)' % (lay.name, lay.width, lay.height)
+        report('generateSuccessor', seconds / generated, '%d successors' % generated)
+
+def depthFirstSearch(state, agentIndex, depth, inPlace):
+    """
+    Visits every state within depth moves of state, either by generating
+    successors or by applying and undoing moves in place.  Returns the
+    number of moves made.
+    """
+    if depth == 0 or state.isWin() or state.isLose(): return 0
+    nextIndex = (agentIndex + 1) % state.getNumAgents()
+    moves = 0
+    for action in state.getLegalActions(agentIndex):
+        if inPlace:
+            record = state.applyMove(agentIndex, action)
+            moves += 1 + depthFirstSearch(state, nextIndex, depth - 1, inPlace)
+            state.undoMove(record)
+        else:
+            successor = state.generateSuccessor(agentIndex, action)
+            moves += 1 + depthFirstSearch(successor, nextIndex, depth - 1, inPlace)
+    return moves
+
+def benchmarkTreeSearch(layouts, repeats):
+    """
+    Moves per second of a depth limited search from the start of each
+    layout, copying states with generateSuccessor versus applyMove/undoMove.
+    The depth grows a round at a time until the search makes enough moves.
+    """
+    import pacman
+    for lay in layouts:
+        state = pacman.GameState()
+        state.initialize(lay, lay.getNumGhosts())
+        depth = state.getNumAgents()
+        while depthFirstSearch(state, 0, depth, True) < repeats * 50:
+            depth += state.getNumAgents()
+        print '%s (%dx%d), depth %d' % (lay.name, lay.width, lay.height, depth)
+        for label, inPlace in [('generateSuccessor', False), ('applyMove/undoMove', True)]:
+            start = time.time()
+            moves = depthFirstSearch(state, 0, depth, inPlace)
+            report(label, (time.time() - start) / moves, '%d moves' % moves)
+
+def benchmarkExpansion(layouts, repeats):
+    """
+    Expanding a state into all of an agent's successors, one action at a
+    time with generateSuccessor versus all at once with generateSuccessors.
+    Objects are the garbage collected objects each expansion keeps alive.
+    """
+    import gc
+    def oneAtATime(state, agentIndex):
+        return [(action, state.generateSuccessor(agentIndex, action)) for action in state.getLegalActions(agentIndex)]
+    def allAtOnce(state, agentIndex):
+        return state.generateSuccessors(agentIndex)
+    for lay in layouts:
+        states = []
+        breadthFirstExpansion(lay, repeats * 20, states)
+        states = [(state, state.data._agentMoved) for state in states if not (state.isWin() or state.isLose())]
+        print '%s (%dx%d)' % (lay.name, lay.width, lay.height)
+        costs = []
+        for label, expand in [('generateSuccessor', oneAtATime), ('generateSuccessors', allAtOnce)]:
+            gc.collect()
+            gc.disable()
+            objects = len(gc.get_objects())
+            start = time.time()
+            kept = [expand(state, (agentIndex + 1) % state.getNumAgents()) for state, agentIndex in states]
+            seconds = time.time() - start
+            objects = len(gc.get_objects()) - objects
+            gc.enable()
+            report(label, seconds / len(states), '%.1f objects per expansion' % (float(objects) / len(states)))
+            costs.append((seconds, float(objects) / len(states)))
+            del kept
+        (oneSeconds, oneObjects), (allSeconds, allObjects) = costs
+        print '  generateSuccessors saves %.0f%% of the time and %.1f objects per expansion' % (
+            100 * (1 - allSeconds / oneSeconds), oneObjects - allObjects)
+
+def residentBytes():
+    """
+    Returns the resident memory of this process.  Where /proc is not
+    available this falls back to the peak, which only ever grows.
+    """
+    import os, resource
+    if os.path.exists('/proc/self/statm'):
+        f = open('/proc/self/statm')
+        try: return int(f.read().split()[1]) * resource.getpagesize()
+        finally: f.close()
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def benchmarkMemory(layouts, repeats):
+    """
+    Memory held by each successor state, measured as the growth of the
+    process while a breadth first expansion of each layout is kept alive.
+    """
+    import gc
+    for lay in layouts:
+        states = []
+        gc.collect()
+        before = residentBytes()
+        generated = breadthFirstExpansion(lay, repeats * 100, states)
+        after = residentBytes()
+        print '%s (%dx%d)' % (lay.name, lay.width, lay.height)
+        print '  %-28s %12.0f bytes  %d successors' % ('per successor', float(after - before) / generated, generated)
+        del states
+
+def turnLimitRules(turns):
+    """
+    Returns the classic rules, changed to also end a game after turns moves.
+    """
+    import pacman
+    class TurnLimitRules(pacman.ClassicGameRules):
+        def process(self, state, game):
+            pacman.ClassicGameRules.process(self, state, game)
+            if len(game.moveHistory) >= turns: game.gameOver = True
+    return TurnLimitRules()
+
+def benchmarkTurns(layouts, repeats):
+    """
+    Turns per second of Game.run with agents that take their first legal
+    action, which is close to the engine's own cost per turn.
+    """
+    import textDisplay
+    from game import Agent
+    class FirstActionAgent(Agent):
+        def getAction(self, state):
+            return state.getLegalActions(self.index)[0]
+    for lay in layouts:
+        agents = [FirstActionAgent(i) for i in range(lay.getNumGhosts() + 1)]
+        rules = turnLimitRules(repeats * 50)
+        turns, seconds = 0, 0.0
+        while turns < repeats * 50:
+            game = rules.newGame(lay, agents[0], agents[1:], textDisplay.NullGraphics(), quiet=True)
+            start = time.time()
+            game.run()
+            seconds += time.time() - start
+            turns += len(game.moveHistory)
+        print '%s (%dx%d)' % (lay.name, lay.width, lay.height)
+        report('Game.run', seconds / turns, '%d turns' % turns)
+
+def benchmarkGames(layouts, repeats):
+    """
+    Games per second of a greedy pacman against random ghosts, played by
+    Game.run and by the headless pacman.simulate.  Games end after at most
+    repeats * 10 moves, as without ghosts they might never end.
+    """
+    import random, pacman, pacmanAgents, ghostAgents, textDisplay
+    numGames, maxMoves = max(1, repeats / 20), repeats * 10
+    for lay in layouts:
+        agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i + 1) for i in range(lay.getNumGhosts())]
+        rules = turnLimitRules(maxMoves)
+        random.seed(0)
+        start = time.time()
+        for i in range(numGames):
+            game = rules.newGame(lay, agents[0], agents[1:], textDisplay.NullGraphics(), quiet=True)
+            game.run()
+        played = time.time() - start
+        start = time.time()
+        results = pacman.simulate(lay, agents, numGames, seed=0, maxMoves=maxMoves)
+        simulated = time.time() - start
+        moves = sum([result.moves for result in results])
+        print '%s (%dx%d)' % (lay.name, lay.width, lay.height)
+        report('Game.run', played / numGames)
+        report('simulate', simulated / numGames, '%d games, %d moves' % (numGames, moves))
+
+def benchmarkEvents(layouts, repeats):
+    """
+    What reporting games to an event sink costs, with a greedy pacman
+    against directional ghosts: how much longer each move takes while the
+    games are played, and the time per move the sink then takes to write the
+    records, in each format.  Games with and without a sink take turns, and
+    CPU time is measured, as the differences are small.  The sinks are only
+    flushed between games, so that playing and writing are timed apart.
+    """
+    import os, random, gameEvents, pacmanAgents, ghostAgents, textDisplay
+    for lay in layouts:
+        agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.DirectionalGhost(i + 1) for i in range(lay.getNumGhosts())]
+        rules = turnLimitRules(repeats * 10)
+        sinks = [('no events', None), ('jsonl', gameEvents.JsonLinesSink(os.devnull, sys.maxint)),
+                 ('binary', gameEvents.BinarySink(os.devnull, sys.maxint))]
+        played, written = [0.0] * len(sinks), [0.0] * len(sinks)
+        moves = 0
+        for i in range(repeats):
+            for j, (name, sink) in enumerate(sinks):
+                random.seed(i)
+                game = rules.newGame(lay, agents[0], agents[1:], textDisplay.NullGraphics(), quiet=True)
+                game.events = sink
+                start = time.clock()
+                game.run()
+                played[j] += time.clock() - start
+                if sink != None:
+                    start = time.clock()
+                    sink.flush()
+                    written[j] += time.clock() - start
+            moves += len(game.moveHistory)
+        print '%s (%dx%d), %d moves' % (lay.name, lay.width, lay.height, moves)
+        report('no events', played[0] / moves)
+        for j in range(1, len(sinks)):
+            report(sinks[j][0], (played[j] + written[j]) / moves, '%+.1f%% per move while playing, %.2fus per move to write (%+.1f%% in all)' % (
+                100 * (played[j] / played[0] - 1), 1e6 * written[j] / moves, 100 * ((played[j] + written[j]) / played[0] - 1)))
+
+def benchmarkBatch(layouts, repeats):
+    """
+    Moves per second of batchPacman playing 1024 games in lock step, with
+    pacman moving at random against each kind of ghost.  Games that end
+    start again.
+    """
+    import batchPacman
+    for lay in layouts:
+        print '%s (%dx%d)' % (lay.name, lay.width, lay.height)
+        for ghostPolicy in batchPacman.GHOST_POLICIES:
+            batch = batchPacman.BatchPacman(lay, 1024, ghostPolicy=ghostPolicy, seed=0)
+            moves = 0
+            start = time.time()
+            for i in range(repeats):
+                batch.step(batch.getRandomPacmanActions())
+                moves += (batch.lastActions >= 0).sum()
+                batch.reset(batch.isOver())
+            report('%s ghosts' % ghostPolicy, (time.time() - start) / moves, '%d moves' % moves)
+
+def benchmarkEnv(layouts, repeats):
+    """
+    Steps per second of a VectorPacmanEnv of 64 games, with pacman moving at
+    random, in this process and spread over a worker per core.
+    """
+    import multiprocessing, numpy, pacmanEnv
+    random = numpy.random.RandomState(0)
+    for lay in layouts:
+        print '%s (%dx%d)' % (lay.name, lay.width, lay.height)
+        for numWorkers in [0, multiprocessing.cpu_count()]:
+            env = pacmanEnv.VectorPacmanEnv(lay, 64, numWorkers)
+            env.reset(seed=0)
+            start = time.time()
+            for i in range(repeats / 4):
+                env.step([random.choice(numpy.flatnonzero(legal)) for legal in env.getLegalActions()])
+            report('%d workers' % numWorkers, (time.time() - start) / (repeats / 4 * 64), '%d steps' % (repeats / 4 * 64))
+            env.close()
+
+BENCHMARKS = [('grid', benchmarkGrid), ('successors', benchmarkSuccessors), ('memory', benchmarkMemory),
+              ('tree', benchmarkTreeSearch), ('expansion', benchmarkExpansion), ('turns', benchmarkTurns),
+              ('games', benchmarkGames), ('events', benchmarkEvents), ('batch', benchmarkBatch),
+              ('env', benchmarkEnv)]
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python benchmark.py [options] [%s]' % '|'.join([name for name, f in BENCHMARKS]))
+    parser.add_option('-l', '--layouts', dest='layouts', default=BIGGEST_LAYOUTS,
+                      help='Comma separated layouts to benchmark [Default: %default]')
+    parser.add_option('-n', '--repeats', dest='repeats', type='int', default=200,
+                      help='How many times to repeat each measurement [Default: %default]')
+    options, names = parser.parse_args(argv)
+    known = dict(BENCHMARKS)
+    for name in names:
+        if name not in known: raise Exception('Unknown benchmark ' + name)
+    layouts = []
+    for name in options.layouts.split(','):
+        lay = layout.getLayout(name)
+        if lay == None: raise Exception("The layout " + name + " cannot be found")
+        lay.name = name
+        layouts.append(lay)
+    return [(name, f) for name, f in BENCHMARKS if not names or name in names], layouts, options.repeats
+
+if __name__ == '__main__':
+    benchmarks, layouts, repeats = readCommand(sys.argv[1:])
+    for name, function in benchmarks:
+        print '== %s: %s' % (name, function.__doc__.strip().replace('\n    ', ' '))
+        function(layouts, repeats)
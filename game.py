@@ -24,6 +24,15 @@ from util import *
 import time, os
 import traceback
 import sys
+import struct, binascii, hashlib
+import random
+import collections
+
+try:
+    import numpy
+    _NUMPY_AVAILABLE = True
+except ImportError:
+    _NUMPY_AVAILABLE = False
 
 #######################
 # Parts worth reading #
@@ -67,7 +76,31 @@ class Directions:
                WEST: EAST,
                STOP: STOP}
 
-class Configuration:
+# Wherever directions are stored as numbers (encoded states, recordings,
+# binary events, batchPacman), they are numbered by their place in this list
+DIRECTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+DIRECTION_CODES = dict([(direction, code) for code, direction in enumerate(DIRECTIONS)])
+
+class SlottedObject(object):
+    """
+    Base for the small classes that the engine copies on every move.  They
+    declare __slots__ instead of carrying a __dict__; this class lets them
+    be pickled with any protocol all the same.
+    """
+    __slots__ = ()
+
+    def __getstate__(self):
+        state = {}
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(self, name): state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+class Configuration(SlottedObject):
     """
     A Configuration holds the (x,y) coordinate of a character, along with its
     traveling direction.
@@ -75,6 +108,7 @@ class Configuration:
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
     """
+    __slots__ = ('pos', 'direction')
 
     def __init__(self, pos, direction):
         self.pos = pos
@@ -117,10 +151,11 @@ class Configuration:
             direction = self.direction # There is no stop direction
         return Configuration((x + dx, y+dy), direction)
 
-class AgentState:
+class AgentState(SlottedObject):
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
     """
+    __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer', 'numCarrying', 'numReturned')
 
     def __init__( self, startConfiguration, isPacman ):
         self.start = startConfiguration
@@ -165,15 +200,27 @@ class Grid:
     via grid[x][y] where (x,y) are positions on a Pacman map with x horizontal,
     y vertical and the origin (0,0) in the bottom left corner.
 
+    Passing useArray=True backs the grid with a numpy bool array of shape
+    (width, height) instead; the grid[x][y] interface is unchanged.
+
     The __str__ method constructs an output that is oriented like a pacman board.
     """
-    def __init__(self, width, height, initialValue=False, bitRepresentation=None):
+    useArray = False
+    readOnly = False
+
+    def __init__(self, width, height, initialValue=False, bitRepresentation=None, useArray=False):
         if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
         self.CELLS_PER_INT = 30
 
         self.width = width
         self.height = height
-        self.data = [[initialValue for y in range(height)] for x in range(width)]
+        if useArray:
+            if not _NUMPY_AVAILABLE: raise Exception('Array-backed grids require numpy')
+            self.useArray = True
+            self.data = numpy.empty((width, height), dtype=bool)
+            self.data.fill(initialValue)
+        else:
+            self.data = [[initialValue for y in range(height)] for x in range(width)]
         if bitRepresentation:
             self._unpackBits(bitRepresentation)
 
@@ -181,8 +228,34 @@ class Grid:
         return self.data[i]
 
     def __setitem__(self, key, item):
+        if self.readOnly: raise Exception('This grid is read-only')
         self.data[key] = item
 
+    def makeReadOnly(self):
+        """
+        Stops the grid from being changed, so that it can be shared safely.
+        Copies of the grid (other than shallowCopy) can be changed as usual.
+        """
+        self.readOnly = True
+        if self.useArray:
+            self.data.flags.writeable = False
+        else:
+            self.data = tuple([tuple(column) for column in self.data])
+
+    def copyOnWrite(self):
+        """
+        Returns a copy of the grid that shares its columns with this grid
+        until they are used (see CopyOnWriteGrid).  The copy can be changed
+        like a deepCopy, but only costs as much as the columns it indexes.
+        Array-backed grids are copied whole.
+        """
+        if self.useArray: return self.copy()
+        g = CopyOnWriteGrid(0, 0)
+        g.width, g.height = self.width, self.height
+        g.data = list(self.data)
+        g._private = [False] * len(g.data)
+        return g
+
     def __str__(self):
         out = [[str(self.data[x][y])[0] for x in range(self.width)] for y in range(self.height)]
         out.reverse()
@@ -190,7 +263,11 @@ class Grid:
 
     def __eq__(self, other):
         if other == None: return False
-        return self.data == other.data
+        if self.useArray or other.useArray:
+            return numpy.array_equal(self.data, other.data)
+        if self.data == other.data: return True
+        # Read-only grids, and copies of them, hold some columns as tuples
+        return map(tuple, self.data) == map(tuple, other.data)
 
     def __hash__(self):
         # return hash(str(self))
@@ -204,63 +281,151 @@ class Grid:
         return hash(h)
 
     def copy(self):
-        g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g = self._emptyCopy()
+        if self.useArray:
+            g.data = self.data.copy()
+        else:
+            g.data = [list(x) for x in self.data]
         return g
 
     def deepCopy(self):
         return self.copy()
 
     def shallowCopy(self):
-        g = Grid(self.width, self.height)
+        g = self._emptyCopy()
+        g.readOnly = self.readOnly
         g.data = self.data
         return g
 
+    def copyForWrite(self, x):
+        """
+        Returns a copy that shares every column except column x with this
+        grid, so column x of the copy can be changed without touching this
+        grid.  Array-backed grids are copied whole.
+        """
+        if self.useArray: return self.copy()
+        g = self._emptyCopy()
+        g.data = list(self.data)
+        g.data[x] = list(g.data[x])
+        return g
+
+    def _emptyCopy(self):
+        "A grid of the same shape and backing whose data is yet to be filled in"
+        g = Grid(0, 0)
+        g.width, g.height = self.width, self.height
+        g.useArray = self.useArray
+        return g
+
     def count(self, item =True ):
+        if self.useArray:
+            return int(numpy.count_nonzero(self.data == item))
         return sum([x.count(item) for x in self.data])
 
     def asList(self, key = True):
+        if self.useArray:
+            return [(int(x), int(y)) for x, y in numpy.argwhere(self.data == key)]
         list = []
         for x in range(self.width):
+            column = self.data[x]
             for y in range(self.height):
-                if self[x][y] == key: list.append( (x,y) )
+                if column[y] == key: list.append( (x,y) )
         return list
 
+    def asArray(self):
+        """
+        Returns the grid as a read-only numpy bool array indexed as
+        array[x][y].  For array-backed grids this is a view of the grid's
+        own data and costs nothing; list-backed grids are converted.
+        """
+        if not _NUMPY_AVAILABLE: raise Exception('asArray requires numpy')
+        if self.useArray:
+            array = self.data.view()
+        else:
+            array = numpy.array(self.data, dtype=bool)
+        array.flags.writeable = False
+        return array
+
     def packBits(self):
         """
         Returns an efficient int list representation
 
         (width, height, bitPackedInts...)
         """
-        bits = [self.width, self.height]
-        currentInt = 0
-        for i in range(self.height * self.width):
-            bit = self.CELLS_PER_INT - (i % self.CELLS_PER_INT) - 1
-            x, y = self._cellIndexToPosition(i)
-            if self[x][y]:
-                currentInt += 2 ** bit
-            if (i + 1) % self.CELLS_PER_INT == 0:
-                bits.append(currentInt)
-                currentInt = 0
-        bits.append(currentInt)
-        return tuple(bits)
+        bits = self._cellBits()
+        if len(bits) % self.CELLS_PER_INT == 0:
+            bits += '0' * self.CELLS_PER_INT
+        else:
+            bits += '0' * (self.CELLS_PER_INT - len(bits) % self.CELLS_PER_INT)
+        ints = [int(bits[i:i + self.CELLS_PER_INT], 2) for i in range(0, len(bits), self.CELLS_PER_INT)]
+        return tuple([self.width, self.height] + ints)
+
+    def packBytes(self):
+        """
+        Returns a compact, versioned byte string representation
+
+        (header, one bit per cell in packBits order, zero padded to a byte)
+
+        Use reconstituteGrid to turn it back into a Grid.
+        """
+        flags = 0
+        if self.useArray: flags |= GRID_FLAG_ARRAY
+        if self.readOnly: flags |= GRID_FLAG_READ_ONLY
+        header = struct.pack(GRID_HEADER_FORMAT, GRID_MAGIC, GRID_FORMAT_VERSION, flags, self.width, self.height)
+        if self.useArray:
+            return header + numpy.packbits(self.data.ravel()).tostring()
+        return header + bitsToBytes(self._cellBits())
+
+    def __getstate__(self):
+        return self.packBytes()
+
+    def __setstate__(self, state):
+        if type(state) is dict: # Pickled before grids were packed
+            self.__dict__.update(state)
+        else:
+            self.__dict__.update(reconstituteGrid(state).__dict__)
 
     def _cellIndexToPosition(self, index):
-        x = index / self.height
+        x = index // self.height
         y = index % self.height
         return x, y
 
+    def _cellBits(self):
+        """
+        Returns the cells as a string of '0' and '1', in cell index order
+        """
+        if self.useArray:
+            return ''.join(numpy.where(self.data.ravel(), '1', '0'))
+        return ''.join([''.join(['1' if cell else '0' for cell in column]) for column in self.data])
+
+    def _setCellBits(self, bits):
+        """
+        Fills in data from a string of '0' and '1' in cell index order
+        """
+        height = self.height
+        bits = bits.ljust(self.width * height, '0')
+        if self.useArray:
+            cells = numpy.fromstring(bits[:self.width * height], dtype=numpy.uint8) == ord('1')
+            self.data = cells.reshape((self.width, height))
+        else:
+            self.data = [[bit == '1' for bit in bits[x * height:(x + 1) * height]] for x in range(self.width)]
+
     def _unpackBits(self, bits):
         """
         Fills in data from a bit-level representation
         """
-        cell = 0
         for packed in bits:
-            for bit in self._unpackInt(packed, self.CELLS_PER_INT):
-                if cell == self.width * self.height: break
-                x, y = self._cellIndexToPosition(cell)
-                self[x][y] = bit
-                cell += 1
+            if packed < 0: raise ValueError, "must be a positive integer"
+        self._setCellBits(''.join([bin(packed)[2:].zfill(self.CELLS_PER_INT) for packed in bits]))
+
+    def _unpackBytes(self, payload):
+        """
+        Fills in data from the body of a packBytes representation
+        """
+        if self.useArray:
+            cells = numpy.unpackbits(numpy.frombuffer(payload, dtype=numpy.uint8))
+            self.data = cells[:self.width * self.height].reshape((self.width, self.height)).astype(bool)
+        else:
+            self._setCellBits(bytesToBits(payload))
 
     def _unpackInt(self, packed, size):
         bools = []
@@ -274,7 +439,70 @@ class Grid:
                 bools.append(False)
         return bools
 
+class CopyOnWriteGrid(Grid):
+    """
+    A grid made by Grid.copyOnWrite, which shares its columns with the grid
+    it was copied from until they are used.  Each column is copied the
+    first time it is indexed, so writing grid[x][y] never changes the
+    original.  Successors made with copyForWrite, and shallow copies, are
+    copy-on-write grids too, so they never hand out shared columns either.
+    """
+
+    def __getitem__(self, i):
+        if self._private[i]: return self.data[i]
+        column = self.data[i] = list(self.data[i])
+        self._private[i] = True
+        return column
+
+    def copyForWrite(self, x):
+        g = self.copyOnWrite()
+        g.data[x] = list(g.data[x])
+        g._private[x] = True
+        return g
+
+    def shallowCopy(self):
+        return self.copyOnWrite()
+
+    def __setstate__(self, state):
+        Grid.__setstate__(self, state)
+        self._private = [True] * len(self.data)
+
+def bitsToBytes(bits):
+    """
+    Packs a string of '0' and '1' into bytes, first bit most significant,
+    zero padding the last byte.
+    """
+    numBytes = (len(bits) + 7) // 8
+    if numBytes == 0: return ''
+    bits += '0' * (numBytes * 8 - len(bits))
+    return binascii.unhexlify('%0*x' % (numBytes * 2, int(bits, 2)))
+
+def bytesToBits(payload):
+    "The inverse of bitsToBytes, including any padding"
+    if not payload: return ''
+    return bin(int(binascii.hexlify(payload), 16))[2:].zfill(len(payload) * 8)
+
+# Layout of the header written by Grid.packBytes
+GRID_MAGIC = 'G'
+GRID_FORMAT_VERSION = 1
+GRID_HEADER_FORMAT = '>cBBHH' # magic, version, flags, width, height
+GRID_HEADER_SIZE = struct.calcsize(GRID_HEADER_FORMAT)
+GRID_FLAG_ARRAY = 1
+GRID_FLAG_READ_ONLY = 2
+
 def reconstituteGrid(bitRep):
+    """
+    Rebuilds a Grid from either packBits (tuple) or packBytes (string)
+    output.  Anything else is assumed to be a Grid already.
+    """
+    if type(bitRep) is str:
+        magic, version, flags, width, height = struct.unpack(GRID_HEADER_FORMAT, bitRep[:GRID_HEADER_SIZE])
+        if magic != GRID_MAGIC: raise ValueError, "not a packed grid"
+        if version != GRID_FORMAT_VERSION: raise ValueError, "unsupported grid format version %d" % version
+        grid = Grid(width, height, useArray=bool(flags & GRID_FLAG_ARRAY))
+        grid._unpackBytes(bitRep[GRID_HEADER_SIZE:])
+        if flags & GRID_FLAG_READ_ONLY: grid.makeReadOnly()
+        return grid
     if type(bitRep) is not type((1,2)):
         return bitRep
     width, height = bitRep[:2]
@@ -368,21 +596,31 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
-class GameStateData:
+class GameStateData(SlottedObject):
     """
 
     """
+    __slots__ = ('food', 'capsules', 'agentStates', 'layout', 'score', 'scoreChange',
+                 '_eaten', '_boardHash', '_agentHash', '_numFood', '_foodEaten', '_foodAdded',
+                 '_capsuleEaten', '_agentMoved', '_lose', '_win')
     def __init__( self, prevState = None ):
         """
         Generates a new data packet by copying information from its predecessor.
         """
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
+            self.food = prevState.food
             self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            self.agentStates = prevState.agentStates[:]
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self._boardHash = prevState._boardHash
+            self._agentHash = prevState._agentHash
+            self._numFood = prevState._numFood
+        else:
+            self._boardHash = None
+            self._agentHash = None
+            self._numFood = None
 
         self._foodEaten = None
         self._foodAdded = None
@@ -395,13 +633,45 @@ class GameStateData:
     def deepCopy( self ):
         state = GameStateData( self )
         state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
+        state.agentStates = self.copyAgentStates( self.agentStates )
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
         state._capsuleEaten = self._capsuleEaten
+        # The copy's food and agents may be changed directly, so its food
+        # count and hash are worked out afresh when they are needed
+        state.resetCaches()
         return state
 
+    def resetCaches( self ):
+        """
+        Forgets the food count and hash, which are otherwise only kept up to
+        date by the game rules.  Call this after changing food, capsules or
+        agent states directly.
+        """
+        self._boardHash = None
+        self._agentHash = None
+        self._numFood = None
+
+    def getNumFood( self ):
+        """
+        Returns how much food is left.  The count is taken once and then
+        kept up to date as food is eaten.
+        """
+        if self._numFood == None:
+            self._numFood = self.food.count()
+        return self._numFood
+
+    def copyAgentStateForWrite( self, index ):
+        """
+        Replaces agentStates[index] with a copy and returns the copy.  A state
+        shares its agent states and food with the state it was copied from,
+        so the rules copy whatever they are about to change.
+        """
+        agentState = self.agentStates[index].copy()
+        self.agentStates[index] = agentState
+        return agentState
+
     def copyAgentStates( self, agentStates ):
         copiedStates = []
         for agentState in agentStates:
@@ -414,6 +684,7 @@ class GameStateData:
         """
         if other == None: return False
         # TODO Check for type of other
+        if hash(self) != hash(other): return False
         if not self.agentStates == other.agentStates: return False
         if not self.food == other.food: return False
         if not self.capsules == other.capsules: return False
@@ -423,14 +694,50 @@ class GameStateData:
     def __hash__( self ):
         """
         Allows states to be keys of dictionaries.
+
+        The hash is a Zobrist hash of the food and capsules, kept up to date
+        by xorBoardKey as things are eaten, and of the agents, kept up to
+        date by updateAgentHash as they move, so once a state has been hashed
+        its successors are hashed without looking at the board.
+        """
+        if self._boardHash == None:
+            self._boardHash = self._computeBoardHash()
+        if self._agentHash == None:
+            h = 0
+            for index, agentState in enumerate( self.agentStates ):
+                h ^= agentKey( index, agentState )
+            self._agentHash = h
+        return hash( ( self._boardHash ^ self._agentHash, self.score ) )
+
+    def _computeBoardHash( self ):
+        h = 0
+        for x, y in self.food.asList():
+            h ^= zobristKey( 'food', x, y )
+        for x, y in self.capsules:
+            h ^= zobristKey( 'capsule', x, y )
+        return h
+
+    def xorBoardKey( self, kind, position ):
+        """
+        Updates the board hash after food or a capsule ('food' or 'capsule')
+        appears or disappears at position.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError, e:
-                print e
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        if self._boardHash != None:
+            self._boardHash ^= zobristKey( kind, position[0], position[1] )
+
+    def updateAgentHash( self, oldAgentStates ):
+        """
+        Updates the agent hash after a move, given the agent states from
+        before it.  The rules replace every agent state they change, so only
+        the replaced ones are rehashed.
+        """
+        if self._agentHash == None: return
+        h = self._agentHash
+        for index, agentState in enumerate( self.agentStates ):
+            oldAgentState = oldAgentStates[index]
+            if agentState is not oldAgentState:
+                h ^= agentKey( index, oldAgentState ) ^ agentKey( index, agentState )
+        self._agentHash = h
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
@@ -484,16 +791,87 @@ class GameStateData:
             return '3'
         return 'E'
 
+    def encode( self ):
+        """
+        Returns a compact byte string holding the agents' positions,
+        directions and scared timers, the remaining food and capsules, the
+        score and the win/lose flags.  The layout is identified by its
+        content hash rather than included; GameStateData.decode needs it.
+
+        Food is stored as one bit per food pellet the layout started with.
+        """
+        layout = self.layout
+        flags = 0
+        if self._win: flags |= STATE_FLAG_WIN
+        if self._lose: flags |= STATE_FLAG_LOSE
+        agentMoved = self._agentMoved
+        if agentMoved == None: agentMoved = STATE_NO_AGENT
+        parts = [struct.pack( STATE_HEADER_FORMAT, STATE_MAGIC, STATE_FORMAT_VERSION, layout.getContentHash(),
+                              flags, len( self.agentStates ), agentMoved, self.score )]
+        for agentState in self.agentStates:
+            x, y = agentState.configuration.pos
+            parts.append( struct.pack( STATE_AGENT_FORMAT, int( x * 2 ), int( y * 2 ),
+                                       DIRECTION_CODES[agentState.configuration.direction], agentState.scaredTimer ) )
+        food = self.food
+        foodBits = ''.join( ['1' if food[x][y] else '0' for x, y in layout.foodPositions] )
+        if foodBits.count( '1' ) != self.getNumFood():
+            raise ValueError( 'Only food the layout started with can be encoded' )
+        capsules = self.capsules
+        capsuleBits = ''.join( ['1' if capsule in capsules else '0' for capsule in layout.capsules] )
+        parts.append( bitsToBytes( foodBits + capsuleBits ) )
+        return ''.join( parts )
+
+    def decode( layout, blob ):
+        """
+        Rebuilds the GameStateData that encode turned into blob, which must
+        have been encoded from a state of the given layout.
+        """
+        magic, version, layoutHash, flags, numAgents, agentMoved, score = \
+            struct.unpack( STATE_HEADER_FORMAT, blob[:STATE_HEADER_SIZE] )
+        if magic != STATE_MAGIC: raise ValueError( 'Not an encoded game state' )
+        if version != STATE_FORMAT_VERSION: raise ValueError( 'Unsupported game state format version %d' % version )
+        if layoutHash != layout.getContentHash(): raise ValueError( 'The game state was encoded for a different layout' )
+
+        data = GameStateData()
+        data.layout = layout
+        data.score = score
+        data._win = bool( flags & STATE_FLAG_WIN )
+        data._lose = bool( flags & STATE_FLAG_LOSE )
+        if agentMoved != STATE_NO_AGENT: data._agentMoved = agentMoved
+
+        # Pacman sorts first, then ghosts in the order initialize adds them
+        data.agentStates = []
+        offset = STATE_HEADER_SIZE
+        for isPacman, start in layout.agentPositions[:numAgents]:
+            x2, y2, direction, scaredTimer = struct.unpack( STATE_AGENT_FORMAT, blob[offset:offset + STATE_AGENT_SIZE] )
+            offset += STATE_AGENT_SIZE
+            agentState = AgentState( Configuration( start, Directions.STOP ), isPacman )
+            agentState.configuration = Configuration( ( _halfUnits( x2 ), _halfUnits( y2 ) ), DIRECTIONS[direction] )
+            agentState.scaredTimer = scaredTimer
+            data.agentStates.append( agentState )
+        data._eaten = [False for a in data.agentStates]
+
+        bits = bytesToBits( blob[offset:] )
+        numFood = len( layout.foodPositions )
+        data.food = Grid( layout.width, layout.height )
+        for ( x, y ), bit in zip( layout.foodPositions, bits[:numFood] ):
+            if bit == '1': data.food[x][y] = True
+        data._numFood = bits[:numFood].count( '1' )
+        data.capsules = [capsule for capsule, bit in zip( layout.capsules, bits[numFood:] ) if bit == '1']
+        return data
+    decode = staticmethod( decode )
+
     def initialize( self, layout, numGhostAgents ):
         """
         Creates an initial game state from a layout array (see layout.py).
         """
         self.food = layout.food.copy()
         #self.capsules = []
-        self.capsules = layout.capsules[:]
+        self.capsules = list( layout.capsules )
         self.layout = layout
         self.score = 0
         self.scoreChange = 0
+        self.resetCaches()
 
         self.agentStates = []
         numGhosts = 0
@@ -504,18 +882,152 @@ class GameStateData:
             self.agentStates.append( AgentState( Configuration( pos, Directions.STOP), isPacman) )
         self._eaten = [False for a in self.agentStates]
 
+# Layout of GameStateData.encode output
+STATE_MAGIC = 'S'
+STATE_FORMAT_VERSION = 1
+STATE_HEADER_FORMAT = '>cB8sBBBi' # magic, version, layout hash, flags, agents, agent moved, score
+STATE_HEADER_SIZE = struct.calcsize(STATE_HEADER_FORMAT)
+STATE_AGENT_FORMAT = '>hhBB' # 2x, 2y, direction, scared timer
+STATE_AGENT_SIZE = struct.calcsize(STATE_AGENT_FORMAT)
+STATE_FLAG_WIN = 1
+STATE_FLAG_LOSE = 2
+STATE_NO_AGENT = 255
+
+def _halfUnits(n):
+    "Converts a count of half squares back to a coordinate, keeping whole ones ints"
+    if n % 2 == 0: return n // 2
+    return n / 2.0
+
+_ZOBRIST_KEYS = {}
+
+def zobristKey( *feature ):
+    """
+    Returns the random key used to hash a feature of a state, such as
+    ('food', x, y).  Keys are taken from a digest of the feature, so they
+    are the same in every process, differ for every pair of features
+    (Python's own tuple hashes collide all over a board) and drawing them
+    does not disturb the global random number generator.
+    """
+    key = _ZOBRIST_KEYS.get( feature )
+    if key == None:
+        key = _ZOBRIST_KEYS[feature] = int( hashlib.md5( repr( feature ) ).hexdigest()[:15], 16 )
+    return key
+
+def agentKey( index, agentState ):
+    "Returns the Zobrist key of agent index being in agentState"
+    conf = agentState.configuration
+    if conf == None: return 0
+    return zobristKey( 'agent', index, conf.pos, conf.direction, agentState.scaredTimer )
+
 try:
     import boinc
     _BOINC_ENABLED = True
 except:
     _BOINC_ENABLED = False
 
+# The most bytes of a muted agent's output that are kept
+AGENT_OUTPUT_LIMIT = 64 * 1024
+
+# The kind of the records Game.run appends to an event sink's batch for each
+# move: (RAW_MOVE, game, turn, agent, action, latency, the _eaten list before
+# the move, and the score, scoreChange, _foodEaten, _capsuleEaten, _eaten and
+# _lose after it).  gameEvents.moveRecords turns them into move records.
+RAW_MOVE = 'rawMove'
+
+class AgentOutput:
+    """
+    A file to capture a muted agent's output in, which keeps only the last
+    limit bytes written to it.  written counts every byte and dropped the
+    bytes given up to stay within the limit.
+    """
+    def __init__(self, limit=None):
+        if limit == None: limit = AGENT_OUTPUT_LIMIT
+        self.limit = limit
+        self.chunks = collections.deque()
+        self.size = 0
+        self.written = 0
+        self.dropped = 0
+
+    def write(self, text):
+        text = str(text)
+        self.written += len(text)
+        self.chunks.append(text)
+        self.size += len(text)
+        while self.size > self.limit:
+            excess = self.size - self.limit
+            first = self.chunks[0]
+            if len(first) <= excess:
+                self.chunks.popleft()
+                self.size -= len(first)
+                self.dropped += len(first)
+            else:
+                self.chunks[0] = first[excess:]
+                self.size -= excess
+                self.dropped += excess
+
+    def writelines(self, lines):
+        for line in lines: self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+    def getvalue(self):
+        "Returns the output kept"
+        return ''.join(self.chunks)
+
+class GameProfile(object):
+    """
+    Where the time of Game.run goes, by phase and by agent.  A game given a
+    profile calls lap after each phase outside its turns, which charges the
+    time since the last lap to that phase of that agent; agentIndex -1 is
+    for the time that belongs to no agent, such as setting up the display.
+    Turns are too short for that, so Game.run times their phases itself
+    and adds them to times once a turn.
+    """
+    PHASES = ['registerInitialState', 'observation', 'getAction', 'generateSuccessor', 'rules', 'display', 'final']
+
+    def __init__(self):
+        self.times = dict([(phase, [0.0]) for phase in self.PHASES])
+        self.games = 0
+        self.last = None
+
+    def start(self, numAgents):
+        "Starts timing a game of numAgents agents"
+        for times in self.times.values():
+            while len(times) < numAgents + 1: times.insert(-1, 0.0)
+        self.games += 1
+        self.last = time.time()
+
+    def lap(self, phase, agentIndex):
+        now = time.time()
+        self.times[phase][agentIndex] += now - self.last
+        self.last = now
+
+    def getTotal(self):
+        return sum([sum(times) for times in self.times.values()])
+
+    def report(self, out=None):
+        "Prints the seconds spent in each phase, in all and by agent"
+        if out == None: out = sys.stdout
+        numAgents = len(self.times[self.PHASES[0]]) - 1
+        total = self.getTotal()
+        print >>out, 'Profile of %d games: %.3f seconds' % (self.games, total)
+        columns = ['agent %d' % i for i in range(numAgents)] + ['other']
+        print >>out, '%-22s %10s %6s' % ('phase', 'seconds', '%'), ' '.join(['%9s' % c for c in columns])
+        for phase in self.PHASES:
+            times = self.times[phase]
+            print >>out, '%-22s %10.3f %6.1f' % (phase, sum(times), 100 * sum(times) / max(total, 1e-9)),
+            print >>out, ' '.join(['%9.3f' % t for t in times])
+
 class Game:
     """
     The Game manages the control flow, soliciting actions from agents.
     """
 
-    def __init__( self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False ):
+    def __init__( self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False, safeObservations=False, outputLimit=None ):
         self.agentCrashed = False
         self.agents = agents
         self.display = display
@@ -524,12 +1036,27 @@ class Game:
         self.gameOver = False
         self.muteAgents = muteAgents
         self.catchExceptions = catchExceptions
+        self.safeObservations = safeObservations
         self.moveHistory = []
         self.totalAgentTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
         self.agentTimeout = False
-        import cStringIO
-        self.agentOutput = [cStringIO.StringIO() for agent in agents]
+        # A GameProfile to time the phases of run in, if any
+        self.profile = None
+        # An event sink (see gameEvents) to report the game to, and the game's number in it
+        self.events = None
+        self.gameIndex = 0
+        # A GameRecorder to record the moves in as they are made, if any
+        self.recorder = None
+        # Muted agents write to buffers that keep their last outputLimit bytes
+        if muteAgents: self.agentOutput = [AgentOutput(outputLimit) for agent in agents]
+        else: self.agentOutput = []
+        # The optional agent methods, looked up once: None where an agent has none
+        self.registerInitialStateHooks = [getattr(agent, 'registerInitialState', None) for agent in agents]
+        self.observationFunctionHooks = [getattr(agent, 'observationFunction', None) for agent in agents]
+        self.finalHooks = [getattr(agent, 'final', None) for agent in agents]
+        # Whether observe hands out makeObservation views, worked out from the first state it sees
+        self.observeByView = None
 
     def getProgress(self):
         if self.gameOver:
@@ -537,12 +1064,28 @@ class Game:
         else:
             return self.rules.getProgress(self)
 
+    def observe( self ):
+        """
+        Returns a copy of the current state for an agent to look at.  States
+        that provide makeObservation hand out a cheap copy-on-write view; with
+        safeObservations set, every agent gets a deep copy instead.
+        """
+        if self.observeByView == None:
+            self.observeByView = not self.safeObservations and hasattr( self.state, 'makeObservation' )
+        if self.observeByView: return self.state.makeObservation()
+        return self.state.deepCopy()
+
     def _agentCrash( self, agentIndex, quiet=False):
         "Helper method for handling agent crashes"
         if not quiet: traceback.print_exc()
         self.gameOver = True
         self.agentCrashed = True
         self.rules.agentCrash(self, agentIndex)
+        if self.events != None:
+            if self.agentTimeout: self.events.agentEvent('timeout', self.gameIndex, len(self.moveHistory), agentIndex)
+            else: self.events.agentEvent('crash', self.gameIndex, len(self.moveHistory), agentIndex, str(sys.exc_info()[1] or ''))
+            self.events.end(self.gameIndex, self.state, len(self.moveHistory), True)
+        if self.recorder != None: self.recorder.finish(False, True)
 
     OLD_STDOUT = None
     OLD_STDERR = None
@@ -550,7 +1093,6 @@ class Game:
     def mute(self, agentIndex):
         if not self.muteAgents: return
         global OLD_STDOUT, OLD_STDERR
-        import cStringIO
         OLD_STDOUT = sys.stdout
         OLD_STDERR = sys.stderr
         sys.stdout = self.agentOutput[agentIndex]
@@ -568,7 +1110,10 @@ class Game:
         """
         Main control loop for game play.
         """
+        profile = self.profile
+        if profile != None: profile.start(len(self.agents))
         self.display.initialize(self.state.data)
+        if profile != None: profile.lap('display', -1)
         self.numMoves = 0
 
         ###self.display.initialize(self.state.makeObservation(1).data)
@@ -583,18 +1128,17 @@ class Game:
                 self.unmute()
                 self._agentCrash(i, quiet=True)
                 return
-            if ("registerInitialState" in dir(agent)):
+            registerInitialState = self.registerInitialStateHooks[i]
+            if registerInitialState != None:
                 self.mute(i)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
+                        timed_func = TimeoutFunction(registerInitialState, self.rules.getMaxStartupTime(i))
                         try:
-                            start_time = time.time()
-                            timed_func(self.state.deepCopy())
-                            time_taken = time.time() - start_time
-                            self.totalAgentTimes[i] += time_taken
+                            timed_func(self.observe())
+                            self.totalAgentTimes[i] += timed_func.elapsed
                         except TimeoutFunctionException:
-                            print >>sys.stderr, "Agent %d ran out of time on startup!" % i
+                            print >>sys.stderr, "Agent %d ran out of time on startup! (%1.3f of %1.3f seconds)" % (i, timed_func.elapsed, timed_func.timeout)
                             self.unmute()
                             self.agentTimeout = True
                             self._agentCrash(i, quiet=True)
@@ -604,64 +1148,89 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    agent.registerInitialState(self.state.deepCopy())
+                    registerInitialState(self.observe())
                 ## TODO: could this exceed the total time
                 self.unmute()
+                if profile != None: profile.lap('registerInitialState', i)
 
         agentIndex = self.startingIndex
         numAgents = len( self.agents )
+        muteAgents = self.muteAgents
+        events = self.events
+        recorder = self.recorder
+        clock = time.time
+        # Moves are appended to the sink's batch as raw move records (see
+        # gameEvents.RAW_MOVE), which it only turns into events when it flushes
+        reporting = events != None
+        if reporting: appendMove, gameIndex = events.batch.append, self.gameIndex
+        # Turns are timed into locals, and charged to the profile once a turn
+        profiling = profile != None
+        if profiling:
+            observationTimes, actionTimes, successorTimes, displayTimes, rulesTimes = [profile.times[phase] for phase in
+                ('observation', 'getAction', 'generateSuccessor', 'display', 'rules')]
+            turnStart = profile.last
 
         while not self.gameOver:
             # Fetch the next agent
             agent = self.agents[agentIndex]
             move_time = 0
             skip_action = False
+            if reporting: moveStart = clock()
             # Generate an observation of the state
-            if 'observationFunction' in dir( agent ):
-                self.mute(agentIndex)
+            observationFunction = self.observationFunctionHooks[agentIndex]
+            if observationFunction != None:
+                if muteAgents: self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
+                        timed_func = TimeoutFunction(observationFunction, self.rules.getMoveTimeout(agentIndex))
                         try:
-                            start_time = time.time()
-                            observation = timed_func(self.state.deepCopy())
+                            observation = timed_func(self.observe())
                         except TimeoutFunctionException:
                             skip_action = True
-                        move_time += time.time() - start_time
+                        move_time += timed_func.elapsed
                         self.unmute()
                     except Exception,data:
                         self._agentCrash(agentIndex, quiet=False)
                         self.unmute()
                         return
                 else:
-                    observation = agent.observationFunction(self.state.deepCopy())
-                self.unmute()
+                    observation = observationFunction(self.observe())
+                if muteAgents: self.unmute()
             else:
-                observation = self.state.deepCopy()
+                observation = self.observe()
+            if profiling: observed = clock()
 
             # Solicit an action
             action = None
-            self.mute(agentIndex)
+            if muteAgents: self.mute(agentIndex)
             if self.catchExceptions:
                 try:
-                    timed_func = TimeoutFunction(agent.getAction, int(self.rules.getMoveTimeout(agentIndex)) - int(move_time))
+                    # The move may use what is left of both the move and the game budget
+                    moveTimeLeft = self.rules.getMoveTimeout(agentIndex) - move_time
+                    totalTimeLeft = self.rules.getMaxTotalTime(agentIndex) - self.totalAgentTimes[agentIndex]
+                    timed_func = TimeoutFunction(agent.getAction, min(moveTimeLeft, totalTimeLeft))
                     try:
-                        start_time = time.time()
-                        if skip_action:
+                        # A budget that is used up already, which TimeoutFunction would take as no limit
+                        if skip_action or min(moveTimeLeft, totalTimeLeft) <= 0:
                             raise TimeoutFunctionException()
                         action = timed_func( observation )
                     except TimeoutFunctionException:
-                        print >>sys.stderr, "Agent %d timed out on a single move!" % agentIndex
+                        move_time += timed_func.elapsed
+                        if moveTimeLeft <= totalTimeLeft:
+                            print >>sys.stderr, "Agent %d timed out on a single move! (%1.3f of %1.3f seconds)" % (agentIndex, move_time, self.rules.getMoveTimeout(agentIndex))
+                        else:
+                            print >>sys.stderr, "Agent %d ran out of time! (time: %1.3f of %1.3f seconds)" % (agentIndex, self.totalAgentTimes[agentIndex] + move_time, self.rules.getMaxTotalTime(agentIndex))
                         self.agentTimeout = True
                         self._agentCrash(agentIndex, quiet=True)
                         self.unmute()
                         return
 
-                    move_time += time.time() - start_time
+                    move_time += timed_func.elapsed
 
                     if move_time > self.rules.getMoveWarningTime(agentIndex):
                         self.totalAgentTimeWarnings[agentIndex] += 1
-                        print >>sys.stderr, "Agent %d took too long to make a move! This is warning %d" % (agentIndex, self.totalAgentTimeWarnings[agentIndex])
+                        print >>sys.stderr, "Agent %d took too long to make a move (%1.3f seconds)! This is warning %d" % (agentIndex, move_time, self.totalAgentTimeWarnings[agentIndex])
+                        if events != None: events.agentEvent('warning', self.gameIndex, len(self.moveHistory), agentIndex, '%1.3f seconds' % move_time)
                         if self.totalAgentTimeWarnings[agentIndex] > self.rules.getMaxTimeWarnings(agentIndex):
                             print >>sys.stderr, "Agent %d exceeded the maximum number of warnings: %d" % (agentIndex, self.totalAgentTimeWarnings[agentIndex])
                             self.agentTimeout = True
@@ -672,7 +1241,7 @@ class Game:
                     self.totalAgentTimes[agentIndex] += move_time
                     #print "Agent: %d, time: %f, total: %f" % (agentIndex, move_time, self.totalAgentTimes[agentIndex])
                     if self.totalAgentTimes[agentIndex] > self.rules.getMaxTotalTime(agentIndex):
-                        print >>sys.stderr, "Agent %d ran out of time! (time: %1.2f)" % (agentIndex, self.totalAgentTimes[agentIndex])
+                        print >>sys.stderr, "Agent %d ran out of time! (time: %1.3f of %1.3f seconds)" % (agentIndex, self.totalAgentTimes[agentIndex], self.rules.getMaxTotalTime(agentIndex))
                         self.agentTimeout = True
                         self._agentCrash(agentIndex, quiet=True)
                         self.unmute()
@@ -684,7 +1253,11 @@ class Game:
                     return
             else:
                 action = agent.getAction(observation)
-            self.unmute()
+            if muteAgents: self.unmute()
+            if profiling: acted = clock()
+            if reporting:
+                latency = clock() - moveStart
+                eatenBefore = self.state.data._eaten
 
             # Execute the action
             self.moveHistory.append( (agentIndex, action) )
@@ -698,14 +1271,29 @@ class Game:
                     return
             else:
                 self.state = self.state.generateSuccessor( agentIndex, action )
+            if profiling: moved = clock()
+            if recorder != None: recorder.record( agentIndex, action, self.state )
 
             # Change the display
             self.display.update( self.state.data )
+            if profiling: displayed = clock()
             ###idx = agentIndex - agentIndex % 2 + 1
             ###self.display.update( self.state.makeObservation(idx).data )
 
             # Allow for game specific conditions (winning, losing, etc.)
             self.rules.process(self.state, self)
+            if profiling:
+                now = clock()
+                observationTimes[agentIndex] += observed - turnStart
+                actionTimes[agentIndex] += acted - observed
+                successorTimes[agentIndex] += moved - acted
+                displayTimes[agentIndex] += displayed - moved
+                rulesTimes[agentIndex] += now - displayed
+                turnStart = now
+            if reporting:
+                data = self.state.data
+                appendMove((RAW_MOVE, gameIndex, len(self.moveHistory), agentIndex, action, latency, eatenBefore, data.score,
+                            data.scoreChange, data._foodEaten, data._capsuleEaten, data._eaten, data._lose))
             # Track progress
             if agentIndex == numAgents + 1: self.numMoves += 1
             # Next agent
@@ -714,16 +1302,22 @@ class Game:
             if _BOINC_ENABLED:
                 boinc.set_fraction_done(self.getProgress())
 
+        if profiling: profile.last = turnStart
+
         # inform a learning agent of the game result
-        for agentIndex, agent in enumerate(self.agents):
-            if "final" in dir( agent ) :
+        for agentIndex, final in enumerate(self.finalHooks):
+            if final != None:
                 try:
                     self.mute(agentIndex)
-                    agent.final( self.state )
+                    final( self.state )
                     self.unmute()
+                    if profile != None: profile.lap('final', agentIndex)
                 except Exception,data:
                     if not self.catchExceptions: raise
                     self._agentCrash(agentIndex)
                     self.unmute()
                     return
         self.display.finish()
+        if profile != None: profile.lap('display', -1)
+        if events != None: events.end(self.gameIndex, self.state, len(self.moveHistory), False)
+        if recorder != None: recorder.finish(self.state.isWin(), False)
@@ -0,0 +1,259 @@
+# gameEvents.py
+# -------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Records of what happens in games, for analysis.
+
+A Game given an event sink (game.events) reports each move, each warning,
+timeout or crash of an agent and the end of the game to it.  Sinks keep
+the records as plain tuples, their kind first and then the fields of the
+matching event class below, and write a batch of them at a time:
+JsonLinesSink as one JSON object per line, BinarySink in the fixed layouts
+below, which readBinaryEvents reads back.  EventList keeps them, and
+makeEvent turns a record into its event.
+
+Moves cost the game as little as possible.  Game.run appends what each is
+made of to the batch as a raw record (see game.RAW_MOVE), and the sink only
+works out the move records, and writes them, when it flushes: as a game
+ends, or when the sink is flushed or closed.
+"""
+from game import SlottedObject, DIRECTIONS, DIRECTION_CODES, RAW_MOVE
+import json, struct
+
+class MoveEvent(SlottedObject):
+    """
+    One move: the agent that made it and its action, the seconds the agent
+    took to observe the state and choose, the score after the move and its
+    change, both floats like the score of an EndEvent, and what the move
+    ate.  pacmanDied is set on the move that killed pacman.
+    """
+    kind = 'move'
+    __slots__ = ('game', 'turn', 'agent', 'action', 'latency', 'score', 'scoreChange',
+                 'foodEaten', 'capsuleEaten', 'ghostsEaten', 'pacmanDied')
+
+    def __init__(self, game, turn, agent, action, latency, score, scoreChange,
+                 foodEaten, capsuleEaten, ghostsEaten, pacmanDied):
+        self.game = game
+        self.turn = turn
+        self.agent = agent
+        self.action = action
+        self.latency = latency
+        self.score = score
+        self.scoreChange = scoreChange
+        self.foodEaten = foodEaten
+        self.capsuleEaten = capsuleEaten
+        self.ghostsEaten = ghostsEaten
+        self.pacmanDied = pacmanDied
+
+class AgentEvent(SlottedObject):
+    """
+    A warning, timeout or crash of an agent (kind is 'warning', 'timeout' or
+    'crash'), at the turn it happened.
+    """
+    __slots__ = ('kind', 'game', 'turn', 'agent', 'message')
+
+    def __init__(self, kind, game, turn, agent, message=''):
+        self.kind = kind
+        self.game = game
+        self.turn = turn
+        self.agent = agent
+        self.message = message
+
+class EndEvent(SlottedObject):
+    "The end of a game"
+    kind = 'end'
+    __slots__ = ('game', 'score', 'win', 'moves', 'crashed')
+
+    def __init__(self, game, score, win, moves, crashed):
+        self.game = game
+        self.score = score
+        self.win = win
+        self.moves = moves
+        self.crashed = crashed
+
+def eventDict(event):
+    "Returns the fields of an event, and its kind, as a dict"
+    fields = {'kind': event.kind}
+    for name in event.__slots__: fields[name] = getattr(event, name)
+    return fields
+
+def moveRecords(records):
+    """
+    Returns records with each raw move record from Game.run (see
+    game.RAW_MOVE) turned into a move record.  Only pacman's moves and moves
+    that eat a ghost give a state an _eaten list of its own, and a ghost can
+    only eat itself, by running into a scared pacman, so only its own entry
+    of that list is new.
+    """
+    moves = []
+    append = moves.append
+    for record in records:
+        if record[0] != RAW_MOVE:
+            append(record)
+            continue
+        kind, game, turn, agentIndex, action, latency, eatenBefore, score, scoreChange, foodEaten, capsuleEaten, eaten, lose = record
+        if eaten is eatenBefore: ghostsEaten = 0
+        elif agentIndex == 0: ghostsEaten = eaten.count(True)
+        else: ghostsEaten = int(eaten[agentIndex])
+        # Scores are floats, as GameState.getScore gives them
+        append(('move', game, turn, agentIndex, action, latency, score + 0.0, scoreChange + 0.0,
+                foodEaten is not None, capsuleEaten is not None, ghostsEaten, lose))
+    return moves
+
+def makeEvent(record):
+    "Returns the event of a record"
+    kind = record[0]
+    if kind == 'move': return MoveEvent(*record[1:])
+    if kind == 'end': return EndEvent(*record[1:])
+    return AgentEvent(*record)
+
+class EventSink(object):
+    """
+    Takes the events of games and writes them out once at least batchSize
+    records are waiting, checked as each event other than a move comes in,
+    so the moves of a game are written as it ends.  Subclasses define
+    write; flush writes whatever is waiting.
+    """
+    def __init__(self, batchSize=1024):
+        self.batchSize = batchSize
+        # Game.run appends to this very list, so it is only ever emptied
+        self.batch = []
+
+    def agentEvent(self, kind, game, turn, agentIndex, message=''):
+        self.emit((kind, game, turn, agentIndex, message))
+
+    def end(self, game, state, moves, crashed):
+        self.emit(('end', game, state.getScore(), state.isWin(), moves, crashed))
+
+    def emit(self, record):
+        self.batch.append(record)
+        if len(self.batch) >= self.batchSize: self.flush()
+
+    def flush(self):
+        batch = self.batch
+        if batch:
+            records = moveRecords(batch)
+            del batch[:]
+            self.write(records)
+
+    def write(self, records):
+        raise Exception('EventSink subclasses must define write')
+
+    def close(self):
+        self.flush()
+
+class EventList(EventSink):
+    "Keeps every record in the list records"
+    def __init__(self):
+        EventSink.__init__(self, 1024)
+        self.records = []
+
+    def write(self, records):
+        self.records.extend(records)
+
+    def getEvents(self):
+        self.flush()
+        return [makeEvent(record) for record in self.records]
+
+class FileSink(EventSink):
+    "A sink that writes to a file, given open or by name"
+    mode = 'w'
+
+    def __init__(self, file, batchSize=1024):
+        EventSink.__init__(self, batchSize)
+        if isinstance(file, str): file = open(file, self.mode)
+        self.file = file
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+# The JSON of a move, filled in from a move record
+MOVE_JSON = ('{"kind": "move", "game": %d, "turn": %d, "agent": %d, "action": "%s", "latency": %.6f, "score": %r, '
+             '"scoreChange": %r, "foodEaten": %s, "capsuleEaten": %s, "ghostsEaten": %d, "pacmanDied": %s}\n')
+JSON_BOOLEANS = {False: 'false', True: 'true'}
+
+class JsonLinesSink(FileSink):
+    "Writes each event as a line of JSON, with its kind among its fields"
+    def write(self, records):
+        lines = []
+        for record in records:
+            if record[0] == 'move':
+                kind, game, turn, agent, action, latency, score, scoreChange, food, capsule, ghosts, died = record
+                lines.append(MOVE_JSON % (game, turn, agent, action, latency, score, scoreChange,
+                                          JSON_BOOLEANS[food], JSON_BOOLEANS[capsule], ghosts, JSON_BOOLEANS[died]))
+            else:
+                lines.append(json.dumps(eventDict(makeEvent(record))) + '\n')
+        self.file.write(''.join(lines))
+        self.file.flush()
+
+# The binary records start with a byte giving their kind
+BINARY_KINDS = ['move', 'warning', 'timeout', 'crash', 'end']
+# kind, game, turn, agent, action, latency, score, scoreChange, foodEaten, capsuleEaten, ghostsEaten, pacmanDied
+MOVE_RECORD = struct.Struct('<BIIBBfddBBBB')
+# kind, game, turn, agent, length of the message that follows
+AGENT_RECORD = struct.Struct('<BIIBH')
+# kind, game, score, win, moves, crashed
+END_RECORD = struct.Struct('<BIdBIB')
+
+class BinarySink(FileSink):
+    """
+    Writes events as packed little-endian records: MOVE_RECORD,
+    AGENT_RECORD followed by the message in UTF-8, or END_RECORD.
+    Actions are numbered by their place in game.DIRECTIONS.
+    """
+    mode = 'wb'
+
+    def write(self, records):
+        packMove = MOVE_RECORD.pack
+        packed = []
+        for record in records:
+            kind = record[0]
+            if kind == 'move':
+                packed.append(packMove(0, record[1], record[2], record[3], DIRECTION_CODES[record[4]], *record[5:]))
+            elif kind == 'end':
+                packed.append(END_RECORD.pack(4, *record[1:]))
+            else:
+                message = record[4]
+                if isinstance(message, unicode): message = message.encode('utf-8')
+                message = message[:0xffff]
+                packed.append(AGENT_RECORD.pack(BINARY_KINDS.index(kind), record[1], record[2], record[3], len(message)))
+                packed.append(message)
+        self.file.write(''.join(packed))
+        self.file.flush()
+
+def readBinaryEvents(file):
+    """
+    Yields the events in a file written by BinarySink, given open or by name.
+    """
+    if isinstance(file, str): file = open(file, 'rb')
+    data = file.read()
+    offset = 0
+    while offset < len(data):
+        kind = BINARY_KINDS[ord(data[offset])]
+        if kind == 'move':
+            fields = MOVE_RECORD.unpack_from(data, offset)
+            offset += MOVE_RECORD.size
+            yield MoveEvent(fields[1], fields[2], fields[3], DIRECTIONS[fields[4]], fields[5], fields[6], fields[7],
+                            bool(fields[8]), bool(fields[9]), fields[10], bool(fields[11]))
+        elif kind == 'end':
+            fields = END_RECORD.unpack_from(data, offset)
+            offset += END_RECORD.size
+            yield EndEvent(fields[1], fields[2], bool(fields[3]), fields[4], bool(fields[5]))
+        else:
+            fields = AGENT_RECORD.unpack_from(data, offset)
+            offset += AGENT_RECORD.size
+            message = data[offset:offset + fields[4]].decode('utf-8', 'replace')
+            offset += fields[4]
+            yield AgentEvent(kind, fields[1], fields[2], fields[3], message)
@@ -0,0 +1,252 @@
+# gameRecorder.py
+# ---------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Records games as they are played, in a compact binary log.
+
+A recording starts with a header (RECORD_HEADER) holding the content hash
+of the layout, the seed of the game and the number of agents.  Then comes
+one two byte record per move, the agent's index and its action numbered
+by its place in game.DIRECTIONS, and finally an end record (END_AGENT, then the
+END_ flags).  Moves are written in batches as the game goes, so if the
+game is cut short the recording holds all but its last few moves and
+simply has no end record.
+
+The layouts are kept apart from the recordings, in a LayoutDictionary
+directory shared by all of them, each stored once under its content hash.
+
+Every KEYFRAME_INTERVAL moves the recorder also saves the state of the
+game, in the compact GameState.encode form, as a keyframe in a second file
+beside the recording (keyframeFileName).  Keeping them apart leaves the
+moves at fixed offsets.
+
+RecordedGame reads a recording by mapping the file into memory: moves are
+decoded from the mapping as they are asked for, and asArray views them as
+a numpy array without copying.  getState rebuilds the state after any
+move from the nearest keyframe before it, so a replay can start anywhere
+or go backwards without playing the game from the start.
+"""
+from game import DIRECTIONS, DIRECTION_CODES
+import layout
+import bisect, mmap, os, struct
+
+RECORD_MAGIC = 'PACREC\x00\x01'
+# magic, layout content hash, seed, whether there is a seed, number of agents
+RECORD_HEADER = struct.Struct('<8s8sQBB')
+# The agent index that marks the end record
+END_AGENT = 0xff
+# The flags of the end record
+END_WIN = 1
+END_CRASHED = 2
+# Where pacman.py keeps the layouts of its recordings, beside them
+LAYOUT_DIRECTORY = 'recorded-layouts'
+# How many moves apart keyframes are
+KEYFRAME_INTERVAL = 256
+# The number of moves before a keyframe and the length of the encoded state that follows
+KEYFRAME_HEADER = struct.Struct('<II')
+
+def keyframeFileName(fileName):
+    "Returns the name of the file of keyframes of the recording fileName"
+    return fileName + '.keys'
+
+class LayoutDictionary:
+    """
+    A directory of layouts, each in a file named by its content hash.  Any
+    number of recorders, in any number of processes, can add to it.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.layouts = {}
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory): raise
+
+    def getFileName(self, key):
+        return os.path.join(self.directory, key.encode('hex') + '.lay')
+
+    def add(self, lay):
+        "Stores lay, unless it is there already, and returns its key"
+        key = lay.getContentHash()
+        if key in self.layouts: return key
+        fileName = self.getFileName(key)
+        if not os.path.exists(fileName):
+            # Written under a name of its own and then moved, so that no reader sees half a layout
+            temporary = '%s.%d' % (fileName, os.getpid())
+            f = open(temporary, 'w')
+            try: f.write('\n'.join(lay.layoutText) + '\n')
+            finally: f.close()
+            os.rename(temporary, fileName)
+        self.layouts[key] = lay
+        return key
+
+    def get(self, key):
+        if key not in self.layouts:
+            lay = layout.tryToLoad(self.getFileName(key))
+            if lay == None: raise Exception('The layout %s is not in %s' % (key.encode('hex'), self.directory))
+            self.layouts[key] = lay
+        return self.layouts[key]
+
+class GameRecorder(object):
+    """
+    Records a game in fileName as it is played.  The game calls record
+    after every move and finish when it ends; moves are written to the
+    file batchSize at a time, and a keyframe is kept every
+    keyframeInterval moves unless that is 0.
+    """
+    def __init__(self, fileName, lay, layouts, numAgents, seed=None, batchSize=64, keyframeInterval=KEYFRAME_INTERVAL):
+        key = layouts.add(lay)
+        self.file = open(fileName, 'wb')
+        self.file.write(RECORD_HEADER.pack(RECORD_MAGIC, key, seed or 0, seed != None, numAgents))
+        self.file.flush()
+        self.batch = []
+        self.batchSize = batchSize
+        self.numMoves = 0
+        self.keyframeInterval = keyframeInterval
+        self.keyframes = []
+        self.keyframeFile = None
+        if keyframeInterval > 0: self.keyframeFile = open(keyframeFileName(fileName), 'wb')
+
+    def record(self, agentIndex, action, state=None):
+        "Records a move, and keeps the state it led to if a keyframe is due"
+        self.batch.append(chr(agentIndex) + chr(DIRECTION_CODES[action]))
+        self.numMoves += 1
+        if state != None and self.keyframeInterval > 0 and self.numMoves % self.keyframeInterval == 0:
+            blob = state.encode()
+            self.keyframes.append(KEYFRAME_HEADER.pack(self.numMoves, len(blob)) + blob)
+        if len(self.batch) >= self.batchSize: self.flush()
+
+    def flush(self):
+        self.file.write(''.join(self.batch))
+        self.file.flush()
+        self.batch = []
+        # Keyframes follow the moves they come after onto the disk
+        if self.keyframes:
+            self.keyframeFile.write(''.join(self.keyframes))
+            self.keyframeFile.flush()
+            self.keyframes = []
+
+    def finish(self, win, crashed):
+        "Writes the end record and closes the file"
+        if self.file.closed: return
+        flags = 0
+        if win: flags |= END_WIN
+        if crashed: flags |= END_CRASHED
+        self.batch.append(chr(END_AGENT) + chr(flags))
+        self.flush()
+        self.file.close()
+        if self.keyframeFile != None: self.keyframeFile.close()
+
+def mapFile(fileName):
+    "Maps fileName into memory, read only"
+    f = open(fileName, 'rb')
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        f.close()
+
+class RecordedGame:
+    """
+    A recording read back from fileName, with its layout from layouts and
+    its keyframes, if it has any.  finished tells whether the game ran to
+    its end; if it did, win and crashed tell how it ended.
+    """
+    def __init__(self, fileName, layouts):
+        self.data = mapFile(fileName)
+        if len(self.data) < RECORD_HEADER.size or self.data[:len(RECORD_MAGIC)] != RECORD_MAGIC:
+            raise Exception(fileName + ' is not a game recording')
+        magic, key, seed, hasSeed, self.numAgents = RECORD_HEADER.unpack_from(self.data, 0)
+        self.layout = layouts.get(key)
+        self.seed = None
+        if hasSeed: self.seed = seed
+        # A record cut in half by a crash is left out
+        end = RECORD_HEADER.size + (len(self.data) - RECORD_HEADER.size) / 2 * 2
+        self.finished = end > RECORD_HEADER.size and ord(self.data[end - 2]) == END_AGENT
+        self.win = self.crashed = False
+        if self.finished:
+            flags = ord(self.data[end - 1])
+            self.win = bool(flags & END_WIN)
+            self.crashed = bool(flags & END_CRASHED)
+            end -= 2
+        self.numMoves = (end - RECORD_HEADER.size) / 2
+
+        # The move each keyframe follows, and where its state is in keyframes
+        self.keyframeMoves = []
+        self.keyframeSpans = []
+        self.keyframes = None
+        keyframeName = keyframeFileName(fileName)
+        if os.path.exists(keyframeName) and os.path.getsize(keyframeName) > 0:
+            self.keyframes = mapFile(keyframeName)
+            offset = 0
+            while offset + KEYFRAME_HEADER.size <= len(self.keyframes):
+                move, length = KEYFRAME_HEADER.unpack_from(self.keyframes, offset)
+                offset += KEYFRAME_HEADER.size
+                # A keyframe cut short, or past the moves that were saved, is left out
+                if offset + length > len(self.keyframes) or move > self.numMoves: break
+                self.keyframeMoves.append(move)
+                self.keyframeSpans.append((offset, offset + length))
+                offset += length
+
+    def __len__(self):
+        return self.numMoves
+
+    def getMove(self, i):
+        "Returns the agent index and action of move i"
+        offset = RECORD_HEADER.size + 2 * i
+        return ord(self.data[offset]), DIRECTIONS[ord(self.data[offset + 1])]
+
+    def __iter__(self):
+        for i in xrange(self.numMoves):
+            yield self.getMove(i)
+
+    def asArray(self):
+        """
+        Returns the moves as a read-only (moves, 2) numpy uint8 array of
+        agent indices and action codes, a view of the file in memory.
+        """
+        import numpy
+        return numpy.frombuffer(self.data, numpy.uint8, 2 * self.numMoves, RECORD_HEADER.size).reshape((self.numMoves, 2))
+
+    def getState(self, i):
+        """
+        Returns the GameState after the first i moves, played on from the
+        last keyframe at or before move i.
+        """
+        import pacman
+        if i < 0 or i > self.numMoves:
+            raise Exception('There is no move %d in a recording of %d moves' % (i, self.numMoves))
+        k = bisect.bisect_right(self.keyframeMoves, i) - 1
+        if k >= 0:
+            start, end = self.keyframeSpans[k]
+            state = pacman.GameState.decode(self.layout, self.keyframes[start:end])
+            move = self.keyframeMoves[k]
+        else:
+            state = pacman.GameState()
+            state.initialize(self.layout, self.numAgents - 1)
+            move = 0
+        while move < i:
+            state = state.generateSuccessor(*self.getMove(move))
+            move += 1
+        return state
+
+    def close(self):
+        self.data.close()
+        if self.keyframes != None: self.keyframes.close()
+
+def isRecording(fileName):
+    "Tells whether fileName holds a recording written by GameRecorder"
+    f = open(fileName, 'rb')
+    try: return f.read(len(RECORD_MAGIC)) == RECORD_MAGIC
+    finally: f.close()
@@ -0,0 +1,348 @@
+# gameServer.py
+# -------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+A server that hosts many games of Pacman at once for pacman agents that
+connect over TCP or a Unix socket, together with a client for agents and
+a load test.
+
+The server is a single event loop: it never waits on one agent, and it
+ends the game of any agent that misses its move deadline.  The ghosts are
+played on the server.  To start a server, type
+
+  python gameServer.py --port 8765
+
+and to check how many games one machine can host at once,
+
+  python gameServer.py --loadTest 300
+
+Client and server exchange JSON objects, one per line:
+
+  client: {"type": "join", "layout": "mediumClassic", "ghosts": "RandomGhost",
+           "numGhosts": 2, "seed": 1}      (all but layout optional)
+  server: {"type": "start", "layout": [lines of the layout], "moveTimeout": 1.0}
+  server: {"type": "observe", "turn": 1, "state": <base64 GameState.encode>,
+           "legal": ["North", ...]}
+  client: {"type": "action", "turn": 1, "action": "North"}
+  server: {"type": "end", "score": 120, "win": false, "moves": 93,
+           "reason": "loss"}       (reason: win, loss, timeout or illegal)
+
+After the end of a game the client may join another on the same connection.
+"""
+import asyncore, asynchat, socket
+import base64, heapq, json, random, time
+import layout, pacman, textDisplay
+
+class GameServer(asyncore.dispatcher):
+    """
+    Listens on address, a (host, port) pair or the path of a Unix socket,
+    and plays a game with every agent that joins.  Pacman must answer each
+    observation within moveTimeout seconds.
+    """
+    def __init__(self, address, moveTimeout=1.0):
+        self.connections = {}
+        asyncore.dispatcher.__init__(self, map=self.connections)
+        if isinstance(address, str):
+            self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.set_reuse_addr()
+        self.bind(address)
+        self.listen(1024)
+        self.address = self.socket.getsockname()
+        self.moveTimeout = moveTimeout
+        self.rules = pacman.ClassicGameRules()
+        self.display = textDisplay.NullGraphics()
+        self.layouts = {}
+        self.ghostTypes = {}
+        # (time, turn, connection) of every move being waited for
+        self.deadlines = []
+        self.running = False
+        self.activeGames = 0
+        self.peakGames = 0
+        self.gamesPlayed = 0
+        self.movesPlayed = 0
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair != None: AgentConnection(self, pair[0])
+
+    def getLayout(self, name):
+        if name not in self.layouts:
+            lay = layout.getLayout(name)
+            if lay == None: raise Exception('The layout ' + str(name) + ' cannot be found')
+            self.layouts[name] = lay
+        return self.layouts[name]
+
+    def getGhostType(self, name):
+        if name not in self.ghostTypes:
+            self.ghostTypes[name] = pacman.loadAgent(name, True)
+        return self.ghostTypes[name]
+
+    def addDeadline(self, connection):
+        heapq.heappush(self.deadlines, (time.time() + self.moveTimeout, connection.turn, connection))
+
+    def expireDeadlines(self):
+        now = time.time()
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, turn, connection = heapq.heappop(self.deadlines)
+            if connection.game != None and connection.turn == turn:
+                connection.endGame('timeout')
+
+    def serve(self, duration=None):
+        """
+        Runs the event loop until stop is called or, if given, duration
+        seconds have passed.
+        """
+        self.running = True
+        end = None
+        if duration != None: end = time.time() + duration
+        while self.running and (end == None or time.time() < end):
+            timeout = 0.1
+            if self.deadlines: timeout = max(0, min(timeout, self.deadlines[0][0] - time.time()))
+            asyncore.loop(timeout, True, self.connections, 1)
+            self.expireDeadlines()
+
+    def stop(self):
+        self.running = False
+
+    def shutdown(self):
+        "Closes the server and every connection to it"
+        self.running = False
+        for connection in self.connections.values():
+            connection.close()
+
+class AgentConnection(asynchat.async_chat):
+    """
+    The server's end of the connection of one pacman agent, and the game it
+    is playing, if any.
+    """
+    def __init__(self, server, sock):
+        asynchat.async_chat.__init__(self, sock, map=server.connections)
+        self.set_terminator('\n')
+        self.server = server
+        self.received = []
+        self.game = None
+        self.ghosts = []
+        self.randomState = None
+        self.turn = 0
+
+    def collect_incoming_data(self, data):
+        self.received.append(data)
+
+    def found_terminator(self):
+        line = ''.join(self.received)
+        self.received = []
+        try:
+            message = json.loads(line)
+            if message.get('type') == 'join' and self.game == None:
+                self.startGame(message)
+            elif message.get('type') == 'action':
+                # Actions that come too late are dropped
+                if self.game != None and message.get('turn') == self.turn: self.playMove(message.get('action'))
+            else:
+                raise Exception('Unexpected message ' + line)
+        except Exception, e:
+            self.sendMessage({'type': 'error', 'message': str(e)})
+
+    def sendMessage(self, message):
+        self.push(json.dumps(message) + '\n')
+
+    def startGame(self, message):
+        lay = self.server.getLayout(message['layout'])
+        ghostType = self.server.getGhostType(message.get('ghosts', 'RandomGhost'))
+        numGhosts = min(message.get('numGhosts', lay.getNumGhosts()), lay.getNumGhosts())
+        self.ghosts = [ghostType(i + 1) for i in range(numGhosts)]
+        self.randomState = random.Random(message.get('seed')).getstate()
+        self.game = self.server.rules.newGame(lay, None, self.ghosts, self.server.display, quiet=True)
+        self.server.activeGames += 1
+        self.server.peakGames = max(self.server.peakGames, self.server.activeGames)
+        self.sendMessage({'type': 'start', 'layout': list(lay.layoutText), 'moveTimeout': self.server.moveTimeout})
+        self.observe()
+
+    def observe(self):
+        self.turn += 1
+        state = self.game.state
+        self.sendMessage({'type': 'observe', 'turn': self.turn, 'state': base64.b64encode(state.encode()),
+                   'legal': state.getLegalActions(0)})
+        self.server.addDeadline(self)
+
+    def playMove(self, action):
+        game = self.game
+        if action not in game.state.getLegalActions(0):
+            self.endGame('illegal')
+            return
+        self.play(0, action)
+        if not game.gameOver and self.ghosts:
+            # Each game's ghosts draw from a random generator of its own
+            outerState = random.getstate()
+            random.setstate(self.randomState)
+            try:
+                for ghost in self.ghosts:
+                    self.play(ghost.index, ghost.getAction(game.state))
+                    if game.gameOver: break
+            finally:
+                self.randomState = random.getstate()
+                random.setstate(outerState)
+        if game.gameOver:
+            if game.state.isWin(): self.endGame('win')
+            else: self.endGame('loss')
+        else:
+            self.observe()
+
+    def play(self, agentIndex, action):
+        game = self.game
+        game.moveHistory.append((agentIndex, action))
+        game.state = game.state.generateSuccessor(agentIndex, action)
+        self.server.rules.process(game.state, game)
+        self.server.movesPlayed += 1
+
+    def endGame(self, reason):
+        state = self.game.state
+        self.sendMessage({'type': 'end', 'score': state.getScore(), 'win': reason == 'win',
+                   'moves': len(self.game.moveHistory), 'reason': reason})
+        self.game = None
+        self.server.activeGames -= 1
+        self.server.gamesPlayed += 1
+
+    def handle_close(self):
+        if self.game != None:
+            self.game = None
+            self.server.activeGames -= 1
+        self.close()
+
+class GameClient:
+    """
+    Connects to a GameServer at address and plays games on it with an
+    ordinary pacman agent, which is shown each state as a GameState.
+    """
+    def __init__(self, address):
+        if isinstance(address, str):
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.connect(address)
+        self.file = self.socket.makefile('r')
+        self.layouts = {}
+
+    def sendMessage(self, message):
+        self.socket.sendall(json.dumps(message) + '\n')
+
+    def receive(self):
+        line = self.file.readline()
+        if not line: raise Exception('The server closed the connection')
+        message = json.loads(line)
+        if message['type'] == 'error': raise Exception('The server refused: ' + message['message'])
+        return message
+
+    def play(self, agent, layoutName, ghosts='RandomGhost', numGhosts=None, seed=None):
+        """
+        Plays a game with agent and returns the server's 'end' message.
+        """
+        join = {'type': 'join', 'layout': layoutName, 'ghosts': ghosts, 'seed': seed}
+        if numGhosts != None: join['numGhosts'] = numGhosts
+        self.sendMessage(join)
+        start = self.receive()
+        key = tuple(start['layout'])
+        if key not in self.layouts: self.layouts[key] = layout.Layout([str(line) for line in key])
+        lay = self.layouts[key]
+        started = False
+        while True:
+            message = self.receive()
+            if message['type'] == 'end': break
+            state = pacman.GameState.decode(lay, base64.b64decode(message['state']))
+            if not started:
+                if hasattr(agent, 'registerInitialState'): agent.registerInitialState(state)
+                started = True
+            self.sendMessage({'type': 'action', 'turn': message['turn'], 'action': agent.getAction(state)})
+        if hasattr(agent, 'final') and started: agent.final(state)
+        return message
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+def loadTest(numGames, layoutName='mediumClassic', moveTimeout=1.0):
+    """
+    Serves numGames games at once to as many client threads, each playing a
+    random legal move, and reports how the server kept up.
+    """
+    import threading, tempfile, os, shutil
+    from game import Agent
+    class RandomAgent(Agent):
+        def getAction(self, state):
+            return random.choice(state.getLegalActions(0))
+
+    directory = tempfile.mkdtemp()
+    server = GameServer(os.path.join(directory, 'pacman.sock'), moveTimeout)
+    serverThread = threading.Thread(target=server.serve)
+    serverThread.daemon = True
+    serverThread.start()
+
+    # Every client joins before any of them plays
+    clients = [GameClient(server.address) for i in range(numGames)]
+    ready = threading.Event()
+    results = [None] * numGames
+    def play(i):
+        ready.wait()
+        results[i] = clients[i].play(RandomAgent(), layoutName, seed=i)
+        clients[i].close()
+    threads = [threading.Thread(target=play, args=(i,)) for i in range(numGames)]
+    for thread in threads: thread.start()
+    start = time.time()
+    ready.set()
+    for thread in threads: thread.join()
+    seconds = time.time() - start
+    server.stop()
+    serverThread.join()
+    server.shutdown()
+    shutil.rmtree(directory)
+
+    reasons = {}
+    for result in results: reasons[result['reason']] = reasons.get(result['reason'], 0) + 1
+    print '%d games on %s in %.1f seconds, at most %d at once' % (numGames, layoutName, seconds, server.peakGames)
+    print '%d moves, %.0f moves per second' % (server.movesPlayed, server.movesPlayed / seconds)
+    print 'Endings:', ', '.join(['%s %d' % item for item in sorted(reasons.items())])
+    return results
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python gameServer.py [options]')
+    parser.add_option('--host', dest='host', default='localhost',
+                      help='The host to listen on [Default: %default]')
+    parser.add_option('-p', '--port', dest='port', type='int', default=8765,
+                      help='The TCP port to listen on [Default: %default]')
+    parser.add_option('--socket', dest='socket', default=None,
+                      help='Listen on this Unix socket instead of TCP')
+    parser.add_option('--moveTimeout', dest='moveTimeout', type='float', default=1.0,
+                      help='Seconds pacman has for each move [Default: %default]')
+    parser.add_option('--loadTest', dest='loadTest', type='int', default=0,
+                      help='Play this many simultaneous local games instead of serving')
+    parser.add_option('-l', '--layout', dest='layout', default='mediumClassic',
+                      help='The layout of the load test [Default: %default]')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+if __name__ == '__main__':
+    import sys
+    options = readCommand(sys.argv[1:])
+    if options.loadTest > 0:
+        loadTest(options.loadTest, options.layout, options.moveTimeout)
+    else:
+        address = options.socket or (options.host, options.port)
+        server = GameServer(address, options.moveTimeout)
+        print 'Serving Pacman games on', server.address
+        server.serve()
@@ -128,7 +128,7 @@ class InfoPane:
 
     def updateGhostDistances(self, distances):
         if len(distances) == 0: return
-        if 'ghostDistanceText' not in dir(self): self.initializeGhostDistances(distances)
+        if not hasattr(self, 'ghostDistanceText'): self.initializeGhostDistances(distances)
         else:
             for i, d in enumerate(distances):
                 changeText(self.ghostDistanceText[i], d)
@@ -250,7 +250,7 @@ class PacmanGraphics:
         if newState._capsuleEaten != None:
             self.removeCapsule(newState._capsuleEaten, self.capsules)
         self.infoPane.updateScore(newState.score)
-        if 'ghostDistances' in dir(newState):
+        if hasattr(newState, 'ghostDistances'):
             self.infoPane.updateGhostDistances(newState.ghostDistances)
 
     def make_window(self, width, height):
@@ -581,7 +581,7 @@ class PacmanGraphics:
                 refresh()
 
     def clearExpandedCells(self):
-        if 'expandedCells' in dir(self) and len(self.expandedCells) > 0:
+        if hasattr(self, 'expandedCells') and len(self.expandedCells) > 0:
             for cell in self.expandedCells:
                 remove_from_screen(cell)
 
@@ -22,6 +22,10 @@ VISIBILITY_MATRIX_CACHE = {}
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    Layouts never change once they are built, and one layout is shared by
+    every state of a game.  Its grids are read-only and its lists are
+    tuples, so that agents cannot change the board for everyone else.
     """
 
     def __init__(self, layoutText):
@@ -33,8 +37,17 @@ class Layout:
         self.agentPositions = []
         self.numGhosts = 0
         self.processLayoutText(layoutText)
-        self.layoutText = layoutText
-        self.totalFood = len(self.food.asList())
+        self.layoutText = tuple(layoutText)
+        self.foodPositions = tuple(self.food.asList())
+        self.totalFood = len(self.foodPositions)
+        self.walls.makeReadOnly()
+        self.food.makeReadOnly()
+        self.capsules = tuple(self.capsules)
+        self.agentPositions = tuple(self.agentPositions)
+        self._contentHash = None
+        self._wallsArray = None
+        self._possibleActions = None
+        self._ghostActions = None
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
@@ -61,6 +74,63 @@ class Layout:
         else:
             self.visibility = VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)]
 
+    def getContentHash(self):
+        """
+        Returns 8 bytes that identify this layout by its text, so that
+        encoded game states can refer to it without containing it.
+        """
+        if self._contentHash == None:
+            import hashlib
+            self._contentHash = hashlib.sha1('\n'.join(self.layoutText)).digest()[:8]
+        return self._contentHash
+
+    def getWallsArray(self):
+        """
+        Returns the walls as a read-only numpy array (see Grid.asArray).
+        The array is built the first time it is asked for and then shared
+        by every state that uses this layout.
+        """
+        if self._wallsArray is None:
+            self._wallsArray = self.walls.asArray()
+        return self._wallsArray
+
+    def getPossibleActions(self, pos):
+        """
+        Returns the tuple of directions (including Stop) that do not run into
+        a wall from the grid point pos, in the order Actions.getPossibleActions
+        gives them.  Returns None if pos is not a grid point of the board.
+        """
+        if self._possibleActions == None: self._buildActionTables()
+        return self._possibleActions.get(pos)
+
+    def getGhostActions(self, pos, direction):
+        """
+        Like getPossibleActions, but for a ghost at pos that is travelling in
+        direction: ghosts cannot stop, and cannot turn around unless they
+        reach a dead end.
+        """
+        if self._ghostActions == None: self._buildActionTables()
+        return self._ghostActions.get((pos, direction))
+
+    def _buildActionTables(self):
+        from game import Actions, Configuration, Directions
+        possibleActions, ghostActions = {}, {}
+        for x in range(self.width):
+            for y in range(self.height):
+                if self.walls[x][y]: continue
+                try:
+                    possible = Actions.getPossibleActions(Configuration((x, y), Directions.STOP), self.walls)
+                except IndexError: # Unwalled edge of the board
+                    continue
+                possibleActions[(x, y)] = tuple(possible)
+                for direction in Actions._directions:
+                    ghost = [action for action in possible if action != Directions.STOP]
+                    reverse = Actions.reverseDirection(direction)
+                    if reverse in ghost and len(ghost) > 1:
+                        ghost.remove(reverse)
+                    ghostActions[((x, y), direction)] = tuple(ghost)
+        self._possibleActions, self._ghostActions = possibleActions, ghostActions
+
     def isWall(self, pos):
         x, col = pos
         return self.walls[x][col]
@@ -90,7 +160,16 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        "Layouts cannot be changed, so a copy is the layout itself"
+        return self
+
+    def __setstate__(self, state):
+        """
+        Unpickled layouts are built again from their text, so that those
+        pickled by older versions, such as in recorded games, get every
+        attribute __init__ sets.
+        """
+        self.__init__(state['layoutText'])
 
     def processLayoutText(self, layoutText):
         """
@@ -0,0 +1,128 @@
+# moveCheck.py
+# ------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Checks that GameState.applyMove, undoMove and generateSuccessors agree with
+generateSuccessor.
+
+crossCheck plays random games, and at every state on the way applies each
+legal move in place, and the moves below it to some depth as a tree search
+would.  Each state a move leads to, and the successor generateSuccessors
+gives for it, must be the same in every field as the successor
+generateSuccessor gives, with a hash that agrees with hashing it
+afresh, and undoing the move must put back the very objects the state was
+made of.  To check some layouts, type
+
+  python moveCheck.py -l mediumClassic,tinySearch -d 3
+"""
+from pacman import GameState
+import random
+
+def describeState(state):
+    """
+    Returns the value of every field of state, as a tuple that compares
+    equal for states that are the same in every way.
+    """
+    data = state.data
+    agents = []
+    for agentState in data.agentStates:
+        start, configuration = agentState.start, agentState.configuration
+        agents.append((start.getPosition(), start.getDirection(), configuration.getPosition(), configuration.getDirection(),
+                       agentState.isPacman, agentState.scaredTimer, agentState.numCarrying, agentState.numReturned))
+    return (tuple(agents), data.food.packBits(), tuple(data.capsules), tuple(data._eaten), data.score, data.scoreChange,
+            data._boardHash, data._agentHash, data._numFood, data._foodEaten, data._foodAdded, data._capsuleEaten, data._agentMoved,
+            data._lose, data._win)
+
+def stateObjects(state):
+    "Returns the objects that state is made of"
+    data = state.data
+    return [data.agentStates, data.food, data.capsules, data._eaten] + data.agentStates
+
+def checkMoves(state, agentIndex, depth):
+    """
+    Applies and undoes every legal move of agentIndex in state, and the
+    moves below each to depth moves in all, checking each against
+    generateSuccessor.  Raises an Exception at the first difference, and
+    returns the number of moves checked.
+    """
+    if depth == 0 or state.isWin() or state.isLose(): return 0
+    before, objects = describeState(state), stateObjects(state)
+    nextAgent = (agentIndex + 1) % state.getNumAgents()
+    moves = 0
+    batch = dict(state.generateSuccessors(agentIndex))
+    for action in state.getLegalActions(agentIndex):
+        successor = state.generateSuccessor(agentIndex, action)
+        if describeState(batch[action]) != describeState(successor):
+            raise Exception('Agent %d moving %s differs between generateSuccessors and generateSuccessor' % (agentIndex, action))
+        record = state.applyMove(agentIndex, action)
+        if describeState(state) != describeState(successor):
+            raise Exception('Agent %d moving %s differs from generateSuccessor' % (agentIndex, action))
+        if hash(state) != hash(successor) or not state == successor:
+            raise Exception('Agent %d moving %s gives a state that is not equal to its successor' % (agentIndex, action))
+        if hash(state) != hash(state.deepCopy()):
+            raise Exception('Agent %d moving %s leaves a hash that differs from hashing the state afresh' % (agentIndex, action))
+        moves += 1 + checkMoves(state, nextAgent, depth - 1)
+        state.undoMove(record)
+        if describeState(state) != before:
+            raise Exception('Undoing agent %d moving %s does not restore the state' % (agentIndex, action))
+        if [a is b for a, b in zip(stateObjects(state), objects)].count(False) > 0:
+            raise Exception('Undoing agent %d moving %s does not put back the objects of the state' % (agentIndex, action))
+    return moves
+
+def crossCheck(layout, numGames=8, maxMoves=400, depth=2, seed=0):
+    """
+    Plays numGames games of at most maxMoves random moves, checking the
+    moves to depth below every state of them with checkMoves.  Returns
+    the number of moves checked.
+    """
+    choice = random.Random(seed).choice
+    moves = 0
+    for i in range(numGames):
+        state = GameState()
+        state.initialize(layout, layout.getNumGhosts())
+        agentIndex = 0
+        for move in range(maxMoves):
+            if state.isWin() or state.isLose(): break
+            try:
+                moves += checkMoves(state, agentIndex, depth)
+            except Exception, e:
+                raise Exception('Game %d, after %d moves: %s' % (i, move, e))
+            state = state.generateSuccessor(agentIndex, choice(state.getLegalActions(agentIndex)))
+            agentIndex = (agentIndex + 1) % state.getNumAgents()
+    return moves
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python moveCheck.py [options]')
+    parser.add_option('-l', '--layouts', dest='layouts', default='mediumClassic,smallClassic,tinySearch',
+                      help='Comma separated layouts to check [Default: %default]')
+    parser.add_option('-n', '--numGames', dest='numGames', type='int', default=8,
+                      help='How many random games to play on each layout [Default: %default]')
+    parser.add_option('-d', '--depth', dest='depth', type='int', default=2,
+                      help='How many moves deep to apply and undo moves below each state [Default: %default]')
+    parser.add_option('-s', '--seed', dest='seed', type='int', default=0,
+                      help='Seed of the random moves [Default: %default]')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+if __name__ == '__main__':
+    import sys, layout
+    options = readCommand(sys.argv[1:])
+    for name in options.layouts.split(','):
+        lay = layout.getLayout(name)
+        if lay == None: raise Exception("The layout " + name + " cannot be found")
+        moves = crossCheck(lay, options.numGames, depth=options.depth, seed=options.seed)
+        print '%d moves on %s agree with generateSuccessor and undo exactly' % (moves, name)
@@ -42,8 +42,10 @@ The keys are 'a', 's', 'd', and 'w' to move (or arrow keys).  Have fun!
 """
 from game import GameStateData
 from game import Game
+from game import GameProfile
 from game import Directions
 from game import Actions
+from game import Configuration
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
@@ -72,12 +74,25 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
-    explored = set()
+    # static variable keeps track of which states have had successors generated.
+    # Tracking is off unless a tracker (see util.ExactStateTracker and
+    # util.ApproximateStateTracker) is installed with setExploredTracker.
+    explored = None
+    def setExploredTracker(tracker):
+        GameState.explored = tracker
+    setExploredTracker = staticmethod(setExploredTracker)
+
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
-        GameState.explored = set()
-        return tmp
+        """
+        Returns what the tracker has seen since the last call and starts
+        over: the set of states with util.ExactStateTracker, a sketch that
+        only supports len() with util.ApproximateStateTracker.  Tracking is
+        off by default, and then the result is always an empty set, so
+        callers that need the states must install an ExactStateTracker
+        (or pass --exploredTracking exact) first.
+        """
+        if GameState.explored == None: return set()
+        return GameState.explored.getAndReset()
     getAndResetExplored = staticmethod(getAndResetExplored)
 
     def getLegalActions( self, agentIndex=0 ):
@@ -101,29 +116,88 @@ class GameState:
 
         # Copy current state
         state = GameState(self)
+        state.resolveMove( agentIndex, action )
 
-        # Let agent's logic deal with its action's effects on the board
-        if agentIndex == 0:  # Pacman is moving
-            state.data._eaten = [False for i in range(state.getNumAgents())]
-            PacmanRules.applyAction( state, action )
-        else:                # A ghost is moving
-            GhostRules.applyAction( state, action, agentIndex )
+        if GameState.explored != None:
+            GameState.explored.add(self)
+            GameState.explored.add(state)
+        return state
 
-        # Time passes
-        if agentIndex == 0:
-            state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
-        else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+    def applyMove( self, agentIndex, action ):
+        """
+        Changes this state in place into the state after the specified agent
+        takes the action, exactly as generateSuccessor would, and returns a
+        record that undoMove can use to change it back.
 
-        # Resolve multi-agent effects
-        GhostRules.checkDeath( state, agentIndex )
+        This saves copying the state at every node of a tree search:
 
-        # Book keeping
-        state.data._agentMoved = agentIndex
-        state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
-        return state
+        record = state.applyMove( agentIndex, action )
+        value = search( state, depth - 1 )
+        state.undoMove( record )
+
+        Moves must be undone in the reverse order they were applied.
+        Explored state tracking ignores moves made this way.
+        """
+        if self.isWin() or self.isLose(): raise Exception('Can\'t apply a move to a terminal state.')
+        data = self.data
+        record = ( data.agentStates, data.food, data.capsules, data._eaten, data.score, data.scoreChange,
+                   data._boardHash, data._agentHash, data._numFood, data._foodEaten, data._foodAdded,
+                   data._capsuleEaten, data._agentMoved )
+        data.agentStates = data.agentStates[:]
+        data.scoreChange = 0
+        data._foodEaten = None
+        data._foodAdded = None
+        data._capsuleEaten = None
+        self.resolveMove( agentIndex, action )
+        return record
+
+    def undoMove( self, record ):
+        """
+        Reverts the move that returned record from applyMove.
+        """
+        data = self.data
+        ( data.agentStates, data.food, data.capsules, data._eaten, data.score, data.scoreChange,
+          data._boardHash, data._agentHash, data._numFood, data._foodEaten, data._foodAdded,
+          data._capsuleEaten, data._agentMoved ) = record
+        data._win = False
+        data._lose = False
+
+    def generateSuccessors( self, agentIndex, actions=None ):
+        """
+        Returns a list of (action, successor) pairs, one for each of the
+        agent's legal actions in the order getLegalActions gives them, or
+        an empty list for a terminal state.  Given actions, only the
+        successors of those actions are generated, in that order, so that
+        an agent can leave out moves it will not take before paying for
+        them.
+
+        This is cheaper than calling generateSuccessor for every action:
+        legality is worked out once, and the successors share everything
+        that their move leaves unchanged, down to the list of capsules.
+        """
+        if self.isWin() or self.isLose(): return []
+        legal = self.getLegalActions( agentIndex )
+        if actions == None:
+            actions = legal
+        else:
+            for action in actions:
+                if action not in legal: raise Exception("Illegal action " + str(action))
+        # The rules replace the capsules and the list of ghosts eaten rather
+        # than change them, so the successors can share one copy of each
+        capsules = self.data.capsules[:]
+        eaten = None
+        if agentIndex == 0: eaten = [False] * self.getNumAgents()
+        successors = []
+        for action in actions:
+            state = GameState(self)
+            state.data.capsules = capsules
+            state.resolveMove( agentIndex, action, checkLegal=False, eaten=eaten )
+            successors.append( ( action, state ) )
+
+        if GameState.explored != None and successors:
+            GameState.explored.add(self)
+            for action, state in successors: GameState.explored.add(state)
+        return successors
 
     def getLegalPacmanActions( self ):
         return self.getLegalActions( 0 )
@@ -175,7 +249,7 @@ class GameState:
         return self.data.capsules
 
     def getNumFood( self ):
-        return self.data.food.count()
+        return self.data.getNumFood()
 
     def getFood(self):
         """
@@ -201,6 +275,15 @@ class GameState:
         """
         return self.data.layout.walls
 
+    def getWallsArray(self):
+        """
+        Returns the walls as a read-only numpy array, indexed like
+        getWalls() as walls[x][y].  The array is built once per layout and
+        shared by every state, so reading it costs nothing per move.
+        Requires numpy.
+        """
+        return self.data.layout.getWallsArray()
+
     def hasFood(self, x, y):
         return self.data.food[x][y]
 
@@ -232,6 +315,39 @@ class GameState:
         state.data = self.data.deepCopy()
         return state
 
+    def makeObservation( self ):
+        """
+        Returns a cheap copy of this state for an agent to look at, used by
+        Game in place of deepCopy.  The copy's food grid copies each column
+        the first time the agent indexes it (see game.CopyOnWriteGrid), and
+        it has agent states of its own, so an agent can change what it
+        observes, as it could a deep copy, without changing the game.
+        Successors of the copy are generated as usual.
+        """
+        state = GameState( self )
+        state.data.food = self.data.food.copyOnWrite()
+        state.data.agentStates = state.data.copyAgentStates( self.data.agentStates )
+        # The agent may change its food and agent states
+        state.data.resetCaches()
+        return state
+
+    def encode( self ):
+        """
+        Returns this state packed into a few dozen bytes, suitable as a
+        transposition table key or for sending to another process.  The
+        layout is not included: GameState.decode( layout, blob ) needs it.
+        """
+        return self.data.encode()
+
+    def decode( layout, blob ):
+        """
+        Rebuilds the GameState that encode turned into blob.
+        """
+        state = GameState()
+        state.data = GameStateData.decode( layout, blob )
+        return state
+    decode = staticmethod( decode )
+
     def __eq__( self, other ):
         """
         Allows two states to be compared.
@@ -248,6 +364,39 @@ class GameState:
 
         return str(self.data)
 
+    def resolveMove( self, agentIndex, action, checkLegal=True, eaten=None ):
+        """
+        Applies the game rules for the specified agent taking the action to
+        this state.  The rules always replace, rather than change, anything
+        this state may share with the state it was copied from.  For pacman's
+        moves, eaten may give the list of ghosts eaten to start from, which
+        must be all False; the rules copy it before marking a ghost.
+        """
+        data = self.data
+        if data._agentHash != None: oldAgentStates = data.agentStates[:]
+
+        # Let agent's logic deal with its action's effects on the board
+        if agentIndex == 0:  # Pacman is moving
+            if eaten == None: eaten = [False] * self.getNumAgents()
+            data._eaten = eaten
+            PacmanRules.applyAction( self, action, checkLegal )
+        else:                # A ghost is moving
+            GhostRules.applyAction( self, action, agentIndex, checkLegal )
+
+        # Time passes
+        if agentIndex == 0:
+            data.scoreChange += -TIME_PENALTY # Penalty for waiting around
+        else:
+            GhostRules.decrementTimer( data.agentStates[agentIndex] )
+
+        # Resolve multi-agent effects
+        GhostRules.checkDeath( self, agentIndex )
+
+        # Book keeping
+        data._agentMoved = agentIndex
+        data.score += data.scoreChange
+        if data._agentHash != None: data.updateAgentHash( oldAgentStates )
+
     def initialize( self, layout, numGhostAgents=1000 ):
         """
         Creates an initial game state from a layout array (see layout.py).
@@ -273,11 +422,11 @@ class ClassicGameRules:
         self.winssofar = 0
         self.excellencescore = 0
 
-    def newGame( self, layout, pacmanAgent, ghostAgents, display, quiet = False, catchExceptions=False):
+    def newGame( self, layout, pacmanAgent, ghostAgents, display, quiet = False, catchExceptions=False, safeObservations=False, muteAgents=False):
         agents = [pacmanAgent] + ghostAgents[:layout.getNumGhosts()]
         initState = GameState()
         initState.initialize( layout, len(ghostAgents) )
-        game = Game(agents, display, self, catchExceptions=catchExceptions)
+        game = Game(agents, display, self, muteAgents=muteAgents, catchExceptions=catchExceptions, safeObservations=safeObservations)
         game.state = initState
         self.initialState = initState.deepCopy()
         self.quiet = quiet
@@ -343,18 +492,23 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions( state.getPacmanState().configuration, state.data.layout.walls )
+        conf = state.data.agentStates[0].configuration
+        possibleActions = state.data.layout.getPossibleActions( conf.pos )
+        if possibleActions == None: # Not on a grid point
+            return Actions.getPossibleActions( conf, state.data.layout.walls )
+        return list( possibleActions )
     getLegalActions = staticmethod( getLegalActions )
 
-    def applyAction( state, action ):
+    def applyAction( state, action, checkLegal=True ):
         """
         Edits the state to reflect the results of the action.
         """
-        legal = PacmanRules.getLegalActions( state )
-        if action not in legal:
-            raise Exception("Illegal action " + str(action))
+        if checkLegal:
+            legal = PacmanRules.getLegalActions( state )
+            if action not in legal:
+                raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.copyAgentStateForWrite( 0 )
 
         # Update Configuration
         vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
@@ -373,21 +527,23 @@ class PacmanRules:
         # Eat food
         if state.data.food[x][y]:
             state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
+            numFood = state.getNumFood() - 1
+            state.data.food = state.data.food.copyForWrite( x )
             state.data.food[x][y] = False
+            state.data._numFood = numFood
+            state.data.xorBoardKey( 'food', position )
             state.data._foodEaten = position
-            # TODO: cache numFood?
-            numFood = state.getNumFood()
             if numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
-            state.data.capsules.remove( position )
+            state.data.capsules = [c for c in state.data.capsules if c != position]
+            state.data.xorBoardKey( 'capsule', position )
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.copyAgentStateForWrite( index ).scaredTimer = SCARED_TIME
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -401,6 +557,10 @@ class GhostRules:
         reach a dead end, but can turn 90 degrees at intersections.
         """
         conf = state.getGhostState( ghostIndex ).configuration
+        ghostActions = state.data.layout.getGhostActions( conf.pos, conf.direction )
+        if ghostActions != None:
+            return list( ghostActions )
+        # In between grid points, e.g. scared ghosts moving at half speed
         possibleActions = Actions.getPossibleActions( conf, state.data.layout.walls )
         reverse = Actions.reverseDirection( conf.direction )
         if Directions.STOP in possibleActions:
@@ -410,13 +570,14 @@ class GhostRules:
         return possibleActions
     getLegalActions = staticmethod( getLegalActions )
 
-    def applyAction( state, action, ghostIndex):
+    def applyAction( state, action, ghostIndex, checkLegal=True ):
 
-        legal = GhostRules.getLegalActions( state, ghostIndex )
-        if action not in legal:
-            raise Exception("Illegal ghost action " + str(action))
+        if checkLegal:
+            legal = GhostRules.getLegalActions( state, ghostIndex )
+            if action not in legal:
+                raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.copyAgentStateForWrite( ghostIndex )
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
         vector = Actions.directionToVector( action, speed )
@@ -426,7 +587,8 @@ class GhostRules:
     def decrementTimer( ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
+            conf = ghostState.configuration
+            ghostState.configuration = Configuration( nearestPoint( conf.pos ), conf.direction )
         ghostState.scaredTimer = max( 0, timer - 1 )
     decrementTimer = staticmethod( decrementTimer )
 
@@ -448,9 +610,11 @@ class GhostRules:
     def collide( state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
             state.data.scoreChange += 200
+            ghostState = state.data.copyAgentStateForWrite( agentIndex )
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
             # Added for first-person
+            state.data._eaten = state.data._eaten[:]
             state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
@@ -522,9 +686,13 @@ def readCommand( argv ):
     parser.add_option('-f', '--fixRandomSeed', action='store_true', dest='fixRandomSeed',
                       help='Fixes the random seed to always play the same game', default=False)
     parser.add_option('-r', '--recordActions', action='store_true', dest='record',
-                      help='Writes game histories to a file (named by the time they were played)', default=False)
+                      help='Records each game as it is played, in a file named by the run and the game number', default=False)
     parser.add_option('--replay', dest='gameToReplay',
-                      help='A recorded game file (pickle) to replay', default=None)
+                      help='A recorded game file to replay', default=None)
+    parser.add_option('--startAt', dest='startAt', type='int',
+                      help=default('With --replay, the move to start showing the game from'), default=0)
+    parser.add_option('--speed', dest='speed', type='float',
+                      help=default('With --replay, how many times faster than --frameTime to show the game'), default=1.0)
     parser.add_option('-a','--agentArgs',dest='agentArgs',
                       help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"')
     parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
@@ -533,8 +701,37 @@ def readCommand( argv ):
                       help=default('Time to delay between frames; <0 means keyboard'), default=0.1)
     parser.add_option('-c', '--catchExceptions', action='store_true', dest='catchExceptions',
                       help='Turns on exception handling and timeouts during games', default=False)
-    parser.add_option('--timeout', dest='timeout', type='int',
-                      help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--timeout', dest='timeout', type='float',
+                      help=default('Maximum length of time in seconds, which may be fractional, an agent can spend computing in a single game'), default=30)
+    parser.add_option('--exploredTracking', dest='exploredTracking', type='choice',
+                      choices=['off', 'exact', 'approximate'],
+                      help=default('Track the states agents generate successors from: off, exact or approximate (a fixed size estimate of how many)'), default='off')
+    parser.add_option('-j', '--jobs', dest='jobs', type='int',
+                      help=default('Number of processes to play games in; above 1 there are no graphics'), default=1)
+    parser.add_option('--seed', dest='seed',
+                      help='Seed every game from this, so that any game of the run can be repeated', default=None)
+    parser.add_option('--isolateAgents', action='store_true', dest='isolateAgents',
+                      help='Run every agent in a process of its own, kept from game to game', default=False)
+    parser.add_option('--agentMemory', dest='agentMemory', type='int',
+                      help='With --isolateAgents, the megabytes of memory each agent process may use', default=None)
+    parser.add_option('--agentCPU', dest='agentCPU', type='float',
+                      help='With --isolateAgents, the processor seconds each agent may use in a game', default=None)
+    parser.add_option('--safeObservations', action='store_true', dest='safeObservations',
+                      help='Give agents deep copies of the game state rather than copy-on-write views', default=False)
+    parser.add_option('--muteAgents', action='store_true', dest='muteAgents',
+                      help='Capture what agents print rather than showing it', default=False)
+    parser.add_option('--agentOutputKB', dest='agentOutputKB', type='int',
+                      help=default('With --muteAgents, the kilobytes of each agent\'s latest output that are kept'), default=64)
+    parser.add_option('--profile', action='store_true', dest='profile',
+                      help='Report the time spent in each phase of the games, by agent', default=False)
+    parser.add_option('--profileStats', dest='profileStats',
+                      help='Save cProfile statistics of the games, for pstats, in this file', default=None)
+    parser.add_option('--profileStacks', dest='profileStacks',
+                      help='Save sampled stacks of the games, in the collapsed format of flame graph tools, in this file', default=None)
+    parser.add_option('--events', dest='events',
+                      help='Write a record of every move, agent warning, timeout or crash and game end to this file', default=None)
+    parser.add_option('--eventFormat', dest='eventFormat', type='choice', choices=['jsonl', 'binary'],
+                      help=default('The format of --events: jsonl or binary (see gameEvents.py)'), default='jsonl')
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -544,6 +741,12 @@ def readCommand( argv ):
     # Fix the random seed
     if options.fixRandomSeed: random.seed('cs188')
 
+    # Track explored states
+    if options.exploredTracking == 'exact':
+        GameState.setExploredTracker(util.ExactStateTracker())
+    elif options.exploredTracking == 'approximate':
+        GameState.setExploredTracker(util.ApproximateStateTracker())
+
     # Choose a layout
     args['layout'] = layout.getLayout( options.layout )
     if args['layout'] == None: raise Exception("The layout " + options.layout + " cannot be found")
@@ -567,8 +770,21 @@ def readCommand( argv ):
     ghostType = loadAgent(options.ghost, noKeyboard)
     args['ghosts'] = [ghostType( i+1 ) for i in range( options.numGhosts )]
 
+    # Run the agents in processes of their own
+    if options.isolateAgents:
+        from agentProcess import ProcessAgent
+        limits = {'memoryLimit': options.agentMemory, 'cpuLimit': options.agentCPU}
+        args['pacman'] = ProcessAgent(options.pacman, 0, (), agentOpts, **limits)
+        args['ghosts'] = [ProcessAgent(options.ghost, i+1, (i+1,), {}, **limits) for i in range( options.numGhosts )]
+
+    # Replays skip ahead before the display is made, and run at their own speed
+    if options.gameToReplay != None:
+        if options.speed <= 0: raise Exception('--speed must be above zero')
+        if options.startAt < 0: raise Exception('--startAt must not be below zero')
+        options.frameTime /= options.speed
+
     # Choose a display format
-    if options.quietGraphics:
+    if options.quietGraphics or options.jobs > 1:
         import textDisplay
         args['display'] = textDisplay.NullGraphics()
     elif options.textGraphics:
@@ -582,15 +798,39 @@ def readCommand( argv ):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['safeObservations'] = options.safeObservations
+    args['muteAgents'] = options.muteAgents
+    args['profile'] = options.profile
+    args['profileStats'] = options.profileStats
+    args['profileStacks'] = options.profileStacks
+    if options.events != None:
+        import gameEvents
+        if options.eventFormat == 'binary': args['events'] = gameEvents.BinarySink(options.events)
+        else: args['events'] = gameEvents.JsonLinesSink(options.events)
+    import game
+    game.AGENT_OUTPUT_LIMIT = options.agentOutputKB * 1024
+    args['jobs'] = options.jobs
+    args['seed'] = options.seed
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
         print 'Replaying recorded game %s.' % options.gameToReplay
-        import cPickle
-        f = open(options.gameToReplay)
-        try: recorded = cPickle.load(f)
-        finally: f.close()
+        import gameRecorder
+        if gameRecorder.isRecording(options.gameToReplay):
+            layouts = gameRecorder.LayoutDictionary(os.path.join(os.path.dirname(options.gameToReplay), gameRecorder.LAYOUT_DIRECTORY))
+            recording = gameRecorder.RecordedGame(options.gameToReplay, layouts)
+            # The recording's keyframes take the replay most of the way to startAt
+            startAt = min(options.startAt, len(recording))
+            recorded = {'layout': recording.layout, 'actions': list(recording), 'startState': recording.getState(startAt)}
+            recording.close()
+        else:
+            # A game recorded whole, with cPickle, by older versions
+            import cPickle
+            f = open(options.gameToReplay)
+            try: recorded = cPickle.load(f)
+            finally: f.close()
         recorded['display'] = args['display']
+        recorded['startAt'] = options.startAt
         replayGame(**recorded)
         sys.exit(0)
 
@@ -619,15 +859,29 @@ def loadAgent(pacman, nographics):
                 return getattr(module, pacman)
     raise Exception('The agent ' + pacman + ' is not specified in any *Agents.py.')
 
-def replayGame( layout, actions, display ):
+def replayGame( layout, actions, display, startAt=0, startState=None ):
+    """
+    Shows the game played by actions, from the state after move startAt
+    on.  The moves before it are played without the display, unless
+    startState, the state they lead to, is given.
+    """
     import pacmanAgents, ghostAgents
     rules = ClassicGameRules()
     agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1) for i in range(layout.getNumGhosts())]
     game = rules.newGame( layout, agents[0], agents[1:], display )
     state = game.state
+    startAt = min(startAt, len(actions))
+    if startState != None:
+        state = startState
+    else:
+        for action in actions[:startAt]:
+            state = state.generateSuccessor( *action )
+    game.state = state
     display.initialize(state.data)
+    # Starting at the end of the game, the game ends on the state shown
+    rules.process(state, game)
 
-    for action in actions:
+    for action in actions[startAt:]:
             # Execute the action
         state = state.generateSuccessor( *action )
         # Change the display
@@ -637,12 +891,48 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30, safeObservations=False, jobs=1, seed=None, muteAgents=False,
+              profile=False, profileStats=None, profileStacks=None, events=None ):
+    """
+    Plays numGames games one after another and prints a summary of the
+    results.  If seed is given, game i is played after
+    random.seed( gameSeed( seed, i ) ), so that any game can be repeated on
+    its own.  With jobs above one the games are played by runGamesInParallel
+    instead.  Either way the GameResult of every game after the training
+    games is returned.
+
+    With profile set, a breakdown of where the games' time went is printed
+    after the summary.  profileStats names a file to save cProfile
+    statistics of the games in, for pstats, and profileStacks one to save
+    sampled stacks in, for flame graphs.
+
+    events is an event sink (see gameEvents) to report every game to, with
+    game i numbered i.  With record set, each game is recorded as it is
+    played (see gameRecorder) in a file named as recordingName describes.
+    """
+    if jobs > 1:
+        if profile or profileStats or profileStacks: raise Exception('Games played in parallel cannot be profiled')
+        return runGamesInParallel( layout, pacman, ghosts, numGames, jobs, seed, numTraining, catchExceptions, timeout, safeObservations, muteAgents, events, record )
     import __main__
     __main__.__dict__['_display'] = display
 
     rules = ClassicGameRules(timeout)
-    games = []
+    results = []
+
+    if record:
+        import gameRecorder
+        recordName = recordingName()
+        layouts = gameRecorder.LayoutDictionary( gameRecorder.LAYOUT_DIRECTORY )
+
+    gameProfile = None
+    if profile: gameProfile = GameProfile()
+    if profileStats:
+        import cProfile
+        statsProfiler = cProfile.Profile()
+        statsProfiler.enable()
+    if profileStacks:
+        stackSampler = util.StackSampler()
+        stackSampler.start()
 
     for i in range( numGames ):
         beQuiet = i < numTraining
@@ -654,28 +944,198 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
         else:
             gameDisplay = display
             rules.quiet = False
-        game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
+        thisSeed = None
+        if seed != None:
+            thisSeed = gameSeed( seed, i )
+            random.seed( thisSeed )
+        game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions, safeObservations, muteAgents)
+        game.profile = gameProfile
+        game.events = events
+        game.gameIndex = i
+        if record: game.recorder = gameRecorder.GameRecorder( '%s-%d.pacrec' % (recordName, i + 1), layout, layouts, len( game.agents ), thisSeed )
         game.run()
-        if not beQuiet: games.append(game)
+        if not beQuiet: results.append( gameResult( game ) )
+
+    if events != None: events.flush()
+    if profileStats:
+        statsProfiler.disable()
+        statsProfiler.dump_stats( profileStats )
+    if profileStacks:
+        stackSampler.stop()
+        stackSampler.write( profileStacks )
 
-        if record:
-            import time, cPickle
-            fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = file(fname, 'w')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            cPickle.dump(components, f)
-            f.close()
+    if (numGames-numTraining) > 0:
+        printSummary( results )
+    if gameProfile != None:
+        gameProfile.report()
+
+    return results
+
+def printSummary( results ):
+    """
+    Prints the scores and wins of a list of GameResults.
+    """
+    scores = [result.score for result in results]
+    wins = [result.win for result in results]
+    winRate = wins.count(True)/ float(len(wins))
+    print 'Average Score:', sum(scores) / float(len(scores))
+    print 'Scores:       ', ', '.join([str(score) for score in scores])
+    print 'Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate)
+    print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins])
+    if GameState.explored != None:
+        print 'States explored:', len(GameState.explored)
+
+def recordingName():
+    """
+    Returns the start of the names of the recordings of a run of games,
+    from the time and the process, so that runs never share names.  Game
+    i of the run is recorded in '<name>-<i+1>.pacrec'.
+    """
+    return 'recorded-game-%s-%d' % ( time.strftime( '%Y%m%d-%H%M%S' ), os.getpid() )
+
+def gameSeed( seed, index ):
+    """
+    Returns the seed of game index in a run of games with the given seed.
+    """
+    import hashlib
+    return int( hashlib.md5( '%s/%d' % (seed, index) ).hexdigest()[:16], 16 )
+
+def runGamesInParallel( layout, pacman, ghosts, numGames, jobs, seed=None, numTraining=0, catchExceptions=False, timeout=30, safeObservations=False, muteAgents=False, events=None, record=False ):
+    """
+    Plays numGames games spread over jobs processes, prints the same summary
+    as runGames and returns the GameResult of every game after the training
+    games, in order.
+
+    Each process sets up the layout and agents once and plays its games
+    without a display, so agents that learn do so separately in each
+    process.  Game i is played after random.seed( gameSeed( seed, i ) ),
+    which makes the results, apart from agent times, the same as those of
+    runGames with the same seed.  Without a seed one is drawn from the
+    random module.
+
+    The events of each game, if events is given, are collected in its
+    process and passed to events as the game finishes.  With record set,
+    the processes record their games as runGames does.
+    """
+    # The workers may have to start processes for agents run with --isolateAgents
+    from agentProcess import HostPool
+    if seed == None: seed = random.getrandbits( 32 )
+    recordName = None
+    if record: recordName = recordingName()
+    pool = HostPool( jobs, _initGameWorker, (layout, pacman, ghosts, timeout, catchExceptions, safeObservations, muteAgents, events != None, recordName) )
+    results = [None] * numGames
+    try:
+        for index, result, workerEvents in pool.imap_unordered( _playWorkerGame, [(i, gameSeed( seed, i )) for i in range( numGames )] ):
+            results[index] = result
+            for event in workerEvents: events.emit( event )
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    pool.join()
+    if events != None: events.flush()
 
     if (numGames-numTraining) > 0:
-        scores = [game.state.getScore() for game in games]
-        wins = [game.state.isWin() for game in games]
-        winRate = wins.count(True)/ float(len(wins))
-        print 'Average Score:', sum(scores) / float(len(scores))
-        print 'Scores:       ', ', '.join([str(score) for score in scores])
-        print 'Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate)
-        print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins])
+        printSummary( results[numTraining:] )
+    return results[numTraining:]
+
+# The layout, agents and rules of a process started by runGamesInParallel
+_gameWorker = None
+
+def _initGameWorker( layout, pacman, ghosts, timeout, catchExceptions, safeObservations, muteAgents, keepEvents, recordName ):
+    global _gameWorker
+    import textDisplay
+    layouts = None
+    if recordName != None:
+        import gameRecorder
+        layouts = gameRecorder.LayoutDictionary( gameRecorder.LAYOUT_DIRECTORY )
+    _gameWorker = (layout, pacman, ghosts, ClassicGameRules( timeout ), textDisplay.NullGraphics(), catchExceptions, safeObservations, muteAgents, keepEvents,
+                   recordName, layouts)
+
+def _playWorkerGame( job ):
+    index, seed = job
+    layout, pacman, ghosts, rules, display, catchExceptions, safeObservations, muteAgents, keepEvents, recordName, layouts = _gameWorker
+    random.seed( seed )
+    game = rules.newGame( layout, pacman, ghosts, display, True, catchExceptions, safeObservations, muteAgents )
+    if recordName != None:
+        import gameRecorder
+        game.recorder = gameRecorder.GameRecorder( '%s-%d.pacrec' % (recordName, index + 1), layout, layouts, len( game.agents ), seed )
+    if keepEvents:
+        from gameEvents import EventList
+        game.events = EventList()
+        game.gameIndex = index
+    game.run()
+    if keepEvents:
+        game.events.flush()
+        return index, gameResult( game ), game.events.records
+    return index, gameResult( game ), []
+
+class GameResult:
+    """
+    The outcome of one game.  agentTimes holds the seconds each agent spent
+    on the game, where they were timed.  Where the game was played in full,
+    state is the state it ended on and moveHistory its moves, as in Game.
+    """
+    def __init__( self, score, win, moves, agentTimes=None, crashed=False, state=None, moveHistory=None ):
+        self.score = score
+        self.win = win
+        self.moves = moves
+        self.agentTimes = agentTimes
+        self.crashed = crashed
+        self.state = state
+        self.moveHistory = moveHistory
+
+    def __repr__( self ):
+        return 'GameResult(score=%r, win=%r, moves=%r, crashed=%r)' % (self.score, self.win, self.moves, self.crashed)
+
+def gameResult( game ):
+    """
+    Returns the GameResult of a game played by Game.run.
+    """
+    return GameResult( game.state.getScore(), game.state.isWin(), len( game.moveHistory ), game.totalAgentTimes[:], game.agentCrashed,
+                       game.state, game.moveHistory )
 
-    return games
+def simulate( layout, agents, numGames, seed=None, maxMoves=None ):
+    """
+    Plays numGames games on layout as fast as possible and returns a
+    GameResult for each.  agents holds pacman followed by the ghosts.
+
+    Only the game rules and the agents run: there is no display, muting,
+    timing, move history or rules bookkeeping.  Agents are handed the game
+    states themselves rather than copies, so they must not change them.
+    If seed is given, game i is played after random.seed( gameSeed( seed, i ) )
+    as in runGames, so that the games play out exactly as runGames, with or
+    without jobs, plays them with the same seed.  Games still going after
+    maxMoves moves, if given, end as neither won nor lost.
+    """
+    agents = agents[:layout.getNumGhosts() + 1]
+    numAgents = len( agents )
+    registerInitialStates = [getattr( agent, 'registerInitialState', None ) for agent in agents]
+    observationFunctions = [getattr( agent, 'observationFunction', None ) for agent in agents]
+    getActions = [agent.getAction for agent in agents]
+    finals = [getattr( agent, 'final', None ) for agent in agents]
+
+    results = []
+    for i in range( numGames ):
+        if seed != None: random.seed( gameSeed( seed, i ) )
+        state = GameState()
+        state.initialize( layout, numAgents - 1 )
+        for registerInitialState in registerInitialStates:
+            if registerInitialState != None: registerInitialState( state )
+        agentIndex = 0
+        moves = 0
+        while True:
+            observation = state
+            observationFunction = observationFunctions[agentIndex]
+            if observationFunction != None: observation = observationFunction( state )
+            state = state.generateSuccessor( agentIndex, getActions[agentIndex]( observation ) )
+            moves += 1
+            if state.isWin() or state.isLose() or moves == maxMoves: break
+            agentIndex = ( agentIndex + 1 ) % numAgents
+        for final in finals:
+            if final != None: final( state )
+        results.append( GameResult( state.getScore(), state.isWin(), moves ) )
+    return results
 
 if __name__ == '__main__':
     """
@@ -690,7 +1150,4 @@ if __name__ == '__main__':
     """
     args = readCommand( sys.argv[1:] ) # Get game components based on input
     runGames( **args )
-
-    # import cProfile
-    # cProfile.run("runGames( **args )")
-    pass
+    if args.get( 'events' ) != None: args['events'].close()
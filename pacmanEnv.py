@@ -0,0 +1,236 @@
+# pacmanEnv.py
+# ------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Pacman as an environment for training: the caller plays pacman through
+reset and step, and ghost agents play the ghosts under ClassicGameRules.
+
+PacmanEnv is a single game.  VectorPacmanEnv steps many games at once,
+spread over worker processes, with the observations in shared memory.
+
+Observations are uint8 arrays of shape (len(OBSERVATION_LAYERS), width,
+height), indexed like the grids as observation[layer][x][y].  Actions are
+numbered by their place in batchPacman.ACTIONS, and an action pacman cannot
+take is played as Stop.
+"""
+import numpy
+import random
+import pacman, textDisplay
+from game import Directions
+from util import nearestPoint
+from batchPacman import ACTIONS
+
+OBSERVATION_LAYERS = ['walls', 'food', 'capsules', 'pacman', 'ghosts', 'scaredGhosts']
+
+def observationArray(state, out=None):
+    """
+    Returns the layers of state named by OBSERVATION_LAYERS, written into
+    out if it is given.  Agents between squares are put on the nearest one.
+    """
+    layout = state.data.layout
+    if out is None:
+        out = numpy.zeros((len(OBSERVATION_LAYERS), layout.width, layout.height), numpy.uint8)
+    else:
+        out[1:] = 0
+    out[0] = layout.getWallsArray()
+    out[1] = state.getFood().asArray()
+    for x, y in state.getCapsules(): out[2, x, y] = 1
+    x, y = nearestPoint(state.getPacmanPosition())
+    out[3, x, y] = 1
+    for ghostState in state.getGhostStates():
+        x, y = nearestPoint(ghostState.getPosition())
+        if ghostState.scaredTimer > 0: out[5, x, y] = 1
+        else: out[4, x, y] = 1
+    return out
+
+class PacmanEnv:
+    """
+    A game of Pacman on layout with a reset/step interface.  The ghosts are
+    ghostType agents (RandomGhost unless given), which draw their moves from
+    a random generator of the environment's own, seeded by reset.
+
+    If out is given, observations are written into it rather than into new
+    arrays, so each one is only good until the next reset or step.
+    """
+    def __init__(self, layout, ghostType=None, numGhosts=None, out=None):
+        import ghostAgents
+        if ghostType == None: ghostType = ghostAgents.RandomGhost
+        if numGhosts == None: numGhosts = layout.getNumGhosts()
+        self.layout = layout
+        self.ghosts = [ghostType(i + 1) for i in range(min(numGhosts, layout.getNumGhosts()))]
+        self.rules = pacman.ClassicGameRules()
+        self.display = textDisplay.NullGraphics()
+        self.out = out
+        self.randomState = random.Random().getstate()
+        self.game = None
+        self.state = None
+
+    def reset(self, seed=None):
+        """
+        Starts a new game and returns its first observation.  If seed is
+        given the ghosts' random generator is seeded with it first.
+        """
+        if seed != None: self.randomState = random.Random(seed).getstate()
+        self.game = self.rules.newGame(self.layout, None, self.ghosts, self.display, quiet=True)
+        self.state = self.game.state
+        return observationArray(self.state, self.out)
+
+    def getLegalActions(self):
+        "Returns a mask of the actions pacman can take now"
+        legal = self.state.getLegalActions(0)
+        return numpy.array([action in legal for action in ACTIONS])
+
+    def step(self, action):
+        """
+        Plays pacman's action, numbered as in ACTIONS, and the ghosts' replies.
+        Returns the observation, the change in score, whether the game is
+        over and a dict with the score and whether pacman won.
+        """
+        if self.game == None or self.game.gameOver:
+            raise Exception('The game is over: call reset to start another')
+        state = self.state
+        direction = ACTIONS[action]
+        if direction not in state.getLegalActions(0): direction = Directions.STOP
+        state = state.generateSuccessor(0, direction)
+        self.rules.process(state, self.game)
+        if not self.game.gameOver and self.ghosts:
+            # The ghosts draw from this game's random generator, not the module's
+            outerState = random.getstate()
+            random.setstate(self.randomState)
+            try:
+                for ghost in self.ghosts:
+                    state = state.generateSuccessor(ghost.index, ghost.getAction(state))
+                    self.rules.process(state, self.game)
+                    if self.game.gameOver: break
+            finally:
+                self.randomState = random.getstate()
+                random.setstate(outerState)
+        reward = state.getScore() - self.state.getScore()
+        self.state = self.game.state = state
+        info = {'score': state.getScore(), 'win': state.isWin()}
+        return observationArray(state, self.out), reward, self.game.gameOver, info
+
+class VectorPacmanEnv:
+    """
+    numEnvs PacmanEnvs stepped together.  With numWorkers above zero the
+    environments are split between that many worker processes; otherwise
+    they run in this one.
+
+    observations, rewards and dones are numpy arrays in shared memory that
+    the workers write into directly.  reset and step return them without
+    copying, so they only hold until the next call.  A game that ends is
+    started again at once: its observation is then the new game's first,
+    and the final score and win of the old game are in its info.
+    """
+    def __init__(self, layout, numEnvs, numWorkers=0, ghostType=None, numGhosts=None):
+        from multiprocessing import sharedctypes
+        self.numEnvs = numEnvs
+        shape = (numEnvs, len(OBSERVATION_LAYERS), layout.width, layout.height)
+        self.observations = numpy.ctypeslib.as_array(sharedctypes.RawArray('B', numEnvs * shape[1] * shape[2] * shape[3])).reshape(shape)
+        self.rewards = numpy.ctypeslib.as_array(sharedctypes.RawArray('d', numEnvs))
+        self.dones = numpy.ctypeslib.as_array(sharedctypes.RawArray('B', numEnvs)).view(bool)
+
+        envArgs = (layout, ghostType, numGhosts, self.observations, self.rewards, self.dones)
+        self.workers = []
+        if numWorkers <= 0:
+            self.local = EnvWorker(range(numEnvs), *envArgs)
+            return
+        import multiprocessing
+        self.local = None
+        for part in range(numWorkers):
+            indices = range(numEnvs)[part::numWorkers]
+            if not indices: continue
+            pipe, workerPipe = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=runEnvWorker, args=(workerPipe, indices) + envArgs)
+            process.daemon = True
+            process.start()
+            workerPipe.close()
+            self.workers.append((pipe, process))
+
+    def call(self, command, argument):
+        if self.local != None: return self.local.handle(command, argument)
+        for pipe, process in self.workers: pipe.send((command, argument))
+        results = {}
+        for pipe, process in self.workers: results.update(pipe.recv())
+        return results
+
+    def reset(self, seed=None):
+        """
+        Starts every game again, environment i seeded with
+        pacman.gameSeed( seed, i ) if seed is given.  Returns the observations.
+        """
+        if seed == None: seeds = [None] * self.numEnvs
+        else: seeds = [pacman.gameSeed(seed, i) for i in range(self.numEnvs)]
+        self.call('reset', seeds)
+        return self.observations
+
+    def step(self, actions):
+        """
+        Plays actions[i] in environment i.  Returns the observations,
+        rewards and dones, and a list of an info dict for each environment.
+        """
+        infos = self.call('step', list(actions))
+        return self.observations, self.rewards, self.dones, [infos.get(i, {}) for i in range(self.numEnvs)]
+
+    def getLegalActions(self):
+        "Returns a (numEnvs, len(ACTIONS)) mask of the actions pacman can take"
+        legal = self.call('legal', None)
+        return numpy.array([legal[i] for i in range(self.numEnvs)])
+
+    def close(self):
+        for pipe, process in self.workers:
+            pipe.send(('close', None))
+        for pipe, process in self.workers:
+            process.join()
+        self.workers = []
+
+class EnvWorker:
+    """
+    The environments of VectorPacmanEnv numbered indices, writing into the
+    shared arrays.
+    """
+    def __init__(self, indices, layout, ghostType, numGhosts, observations, rewards, dones):
+        self.indices = indices
+        self.envs = [PacmanEnv(layout, ghostType, numGhosts, observations[i]) for i in indices]
+        self.rewards = rewards
+        self.dones = dones
+
+    def handle(self, command, argument):
+        """
+        Carries out command for every environment, returning a dict of
+        results by environment number.
+        """
+        results = {}
+        for i, env in zip(self.indices, self.envs):
+            if command == 'reset':
+                env.reset(argument[i])
+                self.rewards[i] = 0
+                self.dones[i] = False
+            elif command == 'step':
+                observation, self.rewards[i], self.dones[i], info = env.step(argument[i])
+                if self.dones[i]:
+                    results[i] = info
+                    env.reset()
+            elif command == 'legal':
+                results[i] = env.getLegalActions()
+        return results
+
+def runEnvWorker(pipe, indices, *envArgs):
+    "The main loop of a VectorPacmanEnv worker process"
+    worker = EnvWorker(indices, *envArgs)
+    while True:
+        command, argument = pipe.recv()
+        if command == 'close': break
+        pipe.send(worker.handle(command, argument))
+    pipe.close()
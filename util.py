@@ -227,6 +227,70 @@ def manhattanDistance( xy1, xy2 ):
     "Returns the Manhattan distance between points xy1 and xy2"
     return abs( xy1[0] - xy2[0] ) + abs( xy1[1] - xy2[1] )
 
+class ExactStateTracker:
+    """
+    Remembers every distinct state it is given.  Install one with
+    GameState.setExploredTracker when the explored states themselves are
+    needed, e.g. for grading.
+    """
+    def __init__(self):
+        self.states = set()
+
+    def add(self, state):
+        self.states.add(state)
+
+    def __len__(self):
+        return len(self.states)
+
+    def getAndReset(self):
+        "Returns the set of states seen so far and starts a new one"
+        states = self.states
+        self.states = set()
+        return states
+
+class ApproximateStateTracker:
+    """
+    Estimates how many distinct states it has been given with a HyperLogLog
+    sketch.  It holds 2**precision small counters however many states are
+    added, and len() is typically within 1.04/sqrt(2**precision) of the
+    true count (about 1.6% at the default precision).
+    """
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = [0] * (1 << precision)
+
+    def add(self, state):
+        h = mix64(hash(state))
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def __len__(self):
+        import math
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum([2.0 ** -r for r in self.registers])
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            estimate = m * math.log(float(m) / zeros) # Small range correction
+        return int(round(estimate))
+
+    def getAndReset(self):
+        "Returns a copy of the sketch so far and starts a new one"
+        snapshot = ApproximateStateTracker(self.precision)
+        snapshot.registers = self.registers
+        self.registers = [0] * (1 << self.precision)
+        return snapshot
+
+def mix64( h ):
+    "Scrambles the bits of a hash value into a well distributed 64 bit integer"
+    h &= 0xFFFFFFFFFFFFFFFF
+    h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return h ^ (h >> 31)
+
 """
   Data structures and functions useful for various course projects
 
@@ -601,47 +665,141 @@ def pause():
 
 # code to handle timeouts
 #
-# FIXME
-# NOTE: TimeoutFuncton is NOT reentrant.  Later timeouts will silently
-# disable earlier timeouts.  Could be solved by maintaining a global list
-# of active time outs.  Currently, questions which have test cases calling
-# this have all student code so wrapped.
+# Timeouts may be fractional.  In the main thread a setitimer alarm
+# interrupts the timed function; a timeout started while another is running
+# puts the outer alarm back when it finishes.  Other threads cannot receive
+# signals, so there a watchdog thread raises the exception in the timed
+# thread instead.  The watchdog cannot break into a blocking call such as
+# time.sleep, but the overrun is still reported once the call returns.
 #
 import signal
 import time
+import threading, thread
+try:
+    import ctypes
+    _ASYNC_EXCEPTIONS = hasattr(ctypes, 'pythonapi')
+except ImportError:
+    _ASYNC_EXCEPTIONS = False
+
 class TimeoutFunctionException(Exception):
     """Exception to raise on a timeout"""
     pass
 
 
+def raiseInThread(ident, exceptionType):
+    """
+    Makes the thread with the given ident raise exceptionType as soon as it
+    next runs Python code.
+    """
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_long(ident), ctypes.py_object(exceptionType))
+
 class TimeoutFunction:
+    """
+    Calls function, raising TimeoutFunctionException if the call takes
+    timeout seconds or more.  A timeout of 0 or less sets no limit.  After
+    each call, elapsed holds the seconds it took, whether or not it timed
+    out.
+    """
     def __init__(self, function, timeout):
         self.timeout = timeout
         self.function = function
+        self.elapsed = 0.0
 
     def handle_timeout(self, signum, frame):
         raise TimeoutFunctionException()
 
     def __call__(self, *args, **keyArgs):
-        # If we have SIGALRM signal, use it to cause an exception if and
-        # when this function runs too long.  Otherwise check the time taken
-        # after the method has returned, and throw an exception then.
-        if hasattr(signal, 'SIGALRM'):
-            old = signal.signal(signal.SIGALRM, self.handle_timeout)
-            signal.alarm(self.timeout)
-            try:
+        startTime = time.time()
+        try:
+            if self.timeout <= 0:
                 result = self.function(*args, **keyArgs)
-            finally:
-                signal.signal(signal.SIGALRM, old)
-            signal.alarm(0)
-        else:
-            startTime = time.time()
-            result = self.function(*args, **keyArgs)
-            timeElapsed = time.time() - startTime
-            if timeElapsed >= self.timeout:
-                self.handle_timeout(None, None)
+            elif hasattr(signal, 'setitimer') and isinstance(threading.current_thread(), threading._MainThread):
+                result = self.callWithAlarm(args, keyArgs)
+            elif _ASYNC_EXCEPTIONS:
+                result = self.callWithWatchdog(args, keyArgs)
+            else:
+                result = self.function(*args, **keyArgs)
+        finally:
+            self.elapsed = time.time() - startTime
+        if self.timeout > 0 and self.elapsed >= self.timeout:
+            self.handle_timeout(None, None)
         return result
 
+    def callWithAlarm(self, args, keyArgs):
+        startTime = time.time()
+        old = signal.signal(signal.SIGALRM, self.handle_timeout)
+        outer, interval = signal.setitimer(signal.ITIMER_REAL, self.timeout)
+        try:
+            return self.function(*args, **keyArgs)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, old)
+            if outer > 0:
+                # Let an enclosing timeout go off, late if need be
+                remaining = max(outer - (time.time() - startTime), 1e-6)
+                signal.setitimer(signal.ITIMER_REAL, remaining, interval)
+
+    def callWithWatchdog(self, args, keyArgs):
+        ident = thread.get_ident()
+        lock = threading.Lock()
+        running = [True]
+        def expire():
+            lock.acquire()
+            try:
+                if running[0]: raiseInThread(ident, TimeoutFunctionException)
+            finally:
+                lock.release()
+        watchdog = threading.Timer(self.timeout, expire)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            return self.function(*args, **keyArgs)
+        finally:
+            lock.acquire()
+            running[0] = False
+            lock.release()
+            watchdog.cancel()
+
+class StackSampler:
+    """
+    Samples the stack of the main thread every interval seconds of processor
+    time and counts the stacks seen.  write saves them in the collapsed
+    format read by flame graph tools, one 'outer;...;inner count' per line.
+
+    The samples come from SIGPROF, so this only works on Unix and must be
+    started from the main thread.  Each sample costs a walk of the stack,
+    which at the default interval slows a program by a few percent.
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = {}
+        self.oldHandler = None
+
+    def sample(self, signum, frame):
+        names = []
+        while frame != None:
+            code = frame.f_code
+            names.append('%s:%s' % (code.co_filename.split('/')[-1], code.co_name))
+            frame = frame.f_back
+        names.reverse()
+        stack = ';'.join(names)
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def start(self):
+        self.oldHandler = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self.oldHandler)
+
+    def write(self, fileName):
+        f = open(fileName, 'w')
+        try:
+            for stack, count in sorted(self.stacks.items()):
+                f.write('%s %d\n' % (stack, count))
+        finally:
+            f.close()
 
 
 _ORIGINAL_STDOUT = None